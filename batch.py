@@ -0,0 +1,166 @@
+"""
+Alson Lee
+Date: 15/03/24
+
+The batch module contains the evaluation of many board states at once with
+NumPy, e.g. to score datasets of board states.
+"""
+
+import board
+import solver
+
+import numpy as np
+
+"""
+Board states are given as arrays of the position (tokens of the current player)
+and mask (tokens of both players) bitboards of the Board class, as uint64.
+Each array operation checks a line of every board state at once.
+"""
+CHUNK_SIZE = 65536  # Max board states evaluated per array operation
+
+# Number of set bits of each byte value
+_BYTE_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def get_line_masks(M: int, N: int, k_in_row: int) -> np.ndarray:
+    """
+    Returns the masks of all k-in-a-row lines of an M by N board as an array.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :return:         uint64 array of line masks
+    """
+    assert (M + 1) * N <= 64, 'board does not fit in 64 bits'
+    return np.array(board.get_all_win_lines(M, N, k_in_row), dtype=np.uint64)
+
+
+def popcount(bits: np.ndarray) -> np.ndarray:
+    """
+    Returns the number of set bits of each bitboard.
+    :param bits: uint64 array of bitboards
+    :return:     int array of the number of set bits
+    """
+    bits = np.ascontiguousarray(bits, dtype=np.uint64)
+    return _BYTE_POPCOUNT[bits.view(np.uint8)].reshape(bits.shape + (8,)).sum(axis=-1, dtype=np.int64)
+
+
+def winning_cells(bits: np.ndarray, other: np.ndarray, lines: np.ndarray) -> np.ndarray:
+    """
+    Returns the empty cells which complete a line for each bitboard, i.e. the
+    missing cell of each line with k-1 tokens of bits and none of other.
+    :param bits:  uint64 array of the tokens of the player
+    :param other: uint64 array of the tokens of the other player
+    :param lines: uint64 array of line masks
+    :return:      uint64 array of the winning cells of each bitboard
+    """
+    missing = lines & ~bits[:, None]
+    single = (missing != 0) & (missing & (missing - np.uint64(1)) == 0)
+    open_line = (lines & other[:, None]) == 0
+    return np.bitwise_or.reduce(np.where(single & open_line, missing, np.uint64(0)), axis=1)
+
+
+def has_k_in_row(bits: np.ndarray, lines: np.ndarray) -> np.ndarray:
+    """
+    Returns if each bitboard has all tokens of a line.
+    :param bits:  uint64 array of bitboards
+    :param lines: uint64 array of line masks
+    :return:      bool array
+    """
+    return ((bits[:, None] & lines) == lines).any(axis=1)
+
+
+def evaluate(M: int, N: int, k_in_row: int, positions, masks) -> dict:
+    """
+    Evaluates the immediate status of many board states of one board size.
+    The player to move is the player of position.
+    :param M:         the board width
+    :param N:         the board height
+    :param k_in_row:  the tokens in a row to win
+    :param positions: the positions of the board states
+    :param masks:     the masks of the board states
+    :return:          dict of arrays:
+                      moves    number of moves played
+                      won      the other player has k in a row
+                      full     all cells are played
+                      terminal won or full
+                      wins     empty cells where the current player wins
+                      threats  empty cells where the other player wins
+                      score    the score if decided without a search, else 0
+                      decided  if the score is decided without a search
+    """
+    positions = np.asarray(positions, dtype=np.uint64)
+    masks = np.asarray(masks, dtype=np.uint64)
+    assert positions.shape == masks.shape, 'positions and masks differ in length'
+
+    lines = get_line_masks(M, N, k_in_row)
+    board_mask = np.uint64(board.get_board_mask(M, N))
+    cells = M * N
+
+    results = {name: [] for name in ('moves', 'won', 'full', 'wins', 'threats')}
+    for start in range(0, len(positions), CHUNK_SIZE):
+        position = positions[start:start + CHUNK_SIZE]
+        mask = masks[start:start + CHUNK_SIZE]
+        opponent = position ^ mask
+        empty = board_mask & ~mask
+
+        results['moves'].append(popcount(mask))
+        results['won'].append(has_k_in_row(opponent, lines))
+        results['full'].append(mask == board_mask)
+        results['wins'].append(winning_cells(position, opponent, lines) & empty)
+        results['threats'].append(winning_cells(opponent, position, lines) & empty)
+
+    dtypes = {'moves': np.int64, 'won': bool, 'full': bool, 'wins': np.uint64, 'threats': np.uint64}
+    results = {name: np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtypes[name])
+               for name, arrays in results.items()}
+    moves, won, full, wins, threats = (results[name] for name in
+                                       ('moves', 'won', 'full', 'wins', 'threats'))
+    results['terminal'] = won | full
+
+    # Scores as in Solver.negamax, the faster the win the higher the score.
+    # A board state already won was lost by the current player a move earlier.
+    double_threat = (threats & (threats - np.uint64(1))) != 0
+    score = np.zeros(len(moves), dtype=np.int64)
+    decided = np.zeros(len(moves), dtype=bool)
+    for condition, value in ((won, -((cells - moves + 2) // 2)),
+                             (full, 0),
+                             (wins != 0, (cells - moves + 1) // 2),
+                             (double_threat, -((cells - moves) // 2))):
+        condition = condition & ~decided
+        score[condition] = value[condition] if np.ndim(value) else value
+        decided |= condition
+
+    results['score'] = score
+    results['decided'] = decided
+    return results
+
+
+def solve_batch(M: int, N: int, k_in_row: int, positions, masks,
+                solver_inst: solver.Solver = None, **solver_options) -> np.ndarray:
+    """
+    Solves many board states of one board size. Board states decided by an
+    immediate win, a loss to two threats or a full board are scored without a
+    search and the rest are solved one at a time by the solver, which keeps
+    its transposition table between them.
+    :param M:              the board width
+    :param N:              the board height
+    :param k_in_row:       the tokens in a row to win
+    :param positions:      the positions of the board states
+    :param masks:          the masks of the board states
+    :param solver_inst:    the solver to use, a new solver if None
+    :param solver_options: the options of a new solver
+    :return:               int array of the score of each board state
+    """
+    positions = np.asarray(positions, dtype=np.uint64)
+    masks = np.asarray(masks, dtype=np.uint64)
+    results = evaluate(M, N, k_in_row, positions, masks)
+    scores = results['score'].copy()
+
+    if solver_inst is None:
+        solver_inst = solver.Solver(board.Board(M=M, N=N, k_in_row=k_in_row), **solver_options)
+
+    for i in np.flatnonzero(~results['decided']):
+        board_inst = board.Board(M=M, N=N, k_in_row=k_in_row, position=int(positions[i]),
+                                 mask=int(masks[i]), moves=int(results['moves'][i]))
+        scores[i] = solver_inst.solve(board_inst)
+
+    return scores
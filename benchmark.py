@@ -0,0 +1,229 @@
+"""
+Alson Lee
+Date: 15/03/24
+
+The benchmark module contains micro-benchmarks of the board and solver, and
+a suite of solves of fixed board states which writes its results to a JSON file.
+
+Usage: python benchmark.py [suite [path]]
+"""
+
+import board
+import mcts
+import solver
+
+import concurrent.futures
+import json
+import platform
+import random
+import sys
+import timeit
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+"""
+BENCHMARK SETTINGS
+"""
+BOARD_SIZES = [(3, 3, 3), (4, 4, 4), (5, 5, 4), (6, 6, 4)]  # (M, N, k) to benchmark
+NUM_POSITIONS = 200  # Number of random positions per board size
+SEED = 0             # Seed of the random positions
+
+SOLVE_SIZES = [(3, 3, 3), (4, 3, 3), (4, 4, 3), (4, 4, 4)]  # (M, N, k) to benchmark the solver
+ORDERING_SIZES = [(5, 4, 3), (4, 4, 4)]  # (M, N, k) to benchmark the move orderings
+ORDERINGS = [(), ('threats',), ('killers',), ('history',), 
+             ('threats', 'killers'), ('threats', 'killers', 'history')]
+
+# (M, N, k, cells played) of the board states of the suite, cells numbered from 0
+SUITE_POSITIONS = [(3, 3, 3, []), (3, 3, 3, [4, 0]),
+                   (4, 4, 3, []), (4, 4, 3, [5, 0]),
+                   (4, 4, 4, []), (4, 4, 4, [5, 10, 6, 9]),
+                   (5, 4, 4, []), (5, 4, 4, [7, 12, 8, 6]),
+                   (5, 5, 4, [12, 6, 13]), (5, 5, 4, [12, 6, 13, 11, 7, 17])]
+MCTS_SIZES = [(3, 3, 3), (5, 5, 4), (7, 7, 5), (9, 9, 5)]  # (M, N, k) to benchmark the MCTS playouts
+MCTS_TIME = 1.0  # Seconds of playouts per board size
+
+SUITE_METHODS = ('solve', 'solve_score_each')
+SUITE_PATH = 'benchmark_results.json'  # Default path of the suite results
+
+
+def random_positions(M: int, N: int, k_in_row: int, num_positions: int, seed: int = SEED) -> list:
+    """
+    Generates random board states which have not been won by playing a random
+    number of random moves.
+    :param M:             the board width
+    :param N:             the board height
+    :param k_in_row:      the tokens in a row to win
+    :param num_positions: the number of board states to generate
+    :param seed:          the seed of the random moves
+    :return:              list of board states
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < num_positions:
+        board_state = board.Board(M=M, N=N, k_in_row=k_in_row)
+        moves = [board_state.cell_to_move(cell) for cell in range(M * N)]
+        rng.shuffle(moves)
+        for move in moves[:rng.randrange(M * N)]:
+            if board_state.is_winning_move(move):
+                break
+            board_state.play(move)
+        positions.append(board_state)
+    return positions
+
+
+def bench_is_winning_move(M: int, N: int, k_in_row: int) -> float:
+    """
+    Measures the calls per second of Board.is_winning_move on every empty cell
+    of random board states.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :return:         the calls per second
+    """
+    calls = [(board_state, move)
+             for board_state in random_positions(M, N, k_in_row, NUM_POSITIONS)
+             for move in range(board_state.bits) if board_state.is_valid_move(move)]
+
+    start = timeit.default_timer()
+    for board_state, move in calls:
+        board_state.is_winning_move(move)
+    end = timeit.default_timer()
+
+    return len(calls) / (end - start)
+
+
+def bench_solve(M: int, N: int, k_in_row: int, **solver_options) -> tuple:
+    """
+    Measures the node throughput of Solver.solve_score_each on the empty board.
+    :param M:              the board width
+    :param N:              the board height
+    :param k_in_row:       the tokens in a row to win
+    :param solver_options: the options of the solver e.g. search, ordering
+    :return:               (nodes, solve time, nodes per second)
+    """
+    board_state = board.Board(M=M, N=N, k_in_row=k_in_row)
+    solve = solver.Solver(board_state, **solver_options)
+
+    start = timeit.default_timer()
+    solve.solve_score_each(board_state)
+    end = timeit.default_timer()
+
+    nodes = solve.get_node_count()
+    return nodes, end - start, nodes / (end - start)
+
+
+def bench_mcts(M: int, N: int, k_in_row: int) -> tuple:
+    """
+    Measures the playout throughput of MCTSSolver.solve_score_each on the empty board.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :return:         (playouts, playouts per second)
+    """
+    board_state = board.Board(M=M, N=N, k_in_row=k_in_row)
+    solve = mcts.MCTSSolver(board_state, time_limit=MCTS_TIME, seed=SEED)
+    solve.solve_score_each(board_state)
+    return solve.get_node_count(), solve.get_playouts_per_sec()
+
+
+def run_case(M: int, N: int, k_in_row: int, cells: list, method: str) -> dict:
+    """
+    Solves a board state of the suite with a new solver. Run in a new process 
+    so the peak memory is of this case only.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :param cells:    the cells played, numbered from 0
+    :param method:   the solver method, solve or solve_score_each
+    :return:         dict of the result of the case
+    """
+    board_state = board.Board(M=M, N=N, k_in_row=k_in_row)
+    board_state.play_sequence([board_state.cell_to_move(cell) for cell in cells])
+    solve = solver.Solver(board_state)
+
+    start = timeit.default_timer()
+    if method == 'solve':
+        result = solve.solve(board_state)
+    else:
+        result = solve.solve_score_each(board_state)
+    end = timeit.default_timer()
+
+    nodes = solve.get_node_count()
+    peak_memory = None
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux but bytes on macOS
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            peak_memory *= 1024
+
+    return {'board': f'{M}x{N}x{k_in_row}', 'cells': cells, 'method': method, 'result': result,
+            'nodes': nodes, 'time': end - start, 'nodes_per_sec': nodes / (end - start),
+            'peak_memory': peak_memory}
+
+
+def run_suite(path: str = SUITE_PATH) -> list:
+    """
+    Runs every method of the solver on every board state of the suite and 
+    writes the results to a JSON file. The results (scores) and nodes are 
+    deterministic, so they can be diffed between commits along with the times.
+    :param path: the path of the results file
+    :return:     list of the result of each case
+    """
+    cases = []
+    for M, N, k_in_row, cells in SUITE_POSITIONS:
+        for method in SUITE_METHODS:
+            # A process per case, so each case starts cold and its peak memory is its own.
+            with concurrent.futures.ProcessPoolExecutor(1) as pool:
+                case = pool.submit(run_case, M, N, k_in_row, cells, method).result()
+            cases.append(case)
+            memory = f'{case["peak_memory"] / 2**20:>8.1f} MiB' if case['peak_memory'] is not None else ''
+            print(f'{case["board"]} {str(cells):<22} {method:<16}: {case["nodes"]:>10,} nodes '
+                  f'{case["time"]:>8.2f}s {case["nodes_per_sec"]:>10,.0f} nodes/s {memory}')
+
+    with open(path, 'w') as f:
+        json.dump({'python': platform.python_version(), 'platform': platform.platform(),
+                   'cases': cases}, f, indent=2)
+    print(f'Results written to {path}')
+    return cases
+
+
+def main():
+    if len(sys.argv) > 1:
+        if sys.argv[1] != 'suite' or len(sys.argv) > 3:
+            print(__doc__.strip().splitlines()[-1])
+            sys.exit(1)
+        run_suite(*sys.argv[2:])
+        return
+
+    print('Board.is_winning_move')
+    for M, N, k_in_row in BOARD_SIZES:
+        calls_per_sec = bench_is_winning_move(M, N, k_in_row)
+        print(f'{M}x{N}x{k_in_row}: {calls_per_sec:>12,.0f} calls/s')
+    print()
+
+    for search in solver.Solver.SEARCH_MODES:
+        print(f'Solver.solve_score_each ({search})')
+        for M, N, k_in_row in SOLVE_SIZES:
+            nodes, solve_time, nodes_per_sec = bench_solve(M, N, k_in_row, search=search)
+            print(f'{M}x{N}x{k_in_row}: {nodes:>10,} nodes {solve_time:>8.2f}s {nodes_per_sec:>10,.0f} nodes/s')
+        print()
+
+    print('Solver.solve_score_each (ordering)')
+    for M, N, k_in_row in ORDERING_SIZES:
+        for ordering in ORDERINGS:
+            nodes, solve_time, nodes_per_sec = bench_solve(M, N, k_in_row, ordering=ordering)
+            name = ', '.join(ordering) if ordering else 'spiral'
+            print(f'{M}x{N}x{k_in_row} {name:<26}: {nodes:>10,} nodes {solve_time:>8.2f}s')
+    print()
+
+    print('MCTSSolver.solve_score_each')
+    for M, N, k_in_row in MCTS_SIZES:
+        playouts, playouts_per_sec = bench_mcts(M, N, k_in_row)
+        print(f'{M}x{N}x{k_in_row}: {playouts:>10,} playouts {playouts_per_sec:>10,.0f} playouts/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,43 @@ Date: 15/03/24
 The board module contains the board game logic for an m,n,k-game.
 """
 
-import numpy as np
+LINE_SCAN_LIMIT = 24  # Max lines per k_in_row to find winning cells by scanning lines
+
+"""
+Class of the derived values of a board size, shared by all its board states.
+"""
+class Geometry:
+    """
+    A geometry is created once per (M, N, k_in_row) by get_geometry and must 
+    not be modified, as every board state of the size shares it.
+    """
+
+    def __init__(self, M: int, N: int, k_in_row: int):
+        assert 2 < M and 2 < N, 'M and N too small'
+        assert k_in_row <= M and k_in_row <= N, 'k_in_row too large'
+
+        self.M = M                   # Board of m width
+        self.N = N                   # Board of n height
+        self.k_in_row = k_in_row     # Require k tokens in a line to win
+        self.cells = M * N           # Number of cells
+
+        # The fastest win for P1 is on move 2k-1 and for P2 is on move 2k.
+        self.min_score = -((self.cells - 2 * k_in_row + 2) // 2)
+        self.max_score = (self.cells - 2 * k_in_row + 3) // 2
+
+        self.stride = M + 1                        # Bits per row including padding
+        self.bits = self.stride * N                # Bits of position and mask
+        self.board_mask = get_board_mask(M, N)     # Bits of all cells
+        self.shifts = (1, self.stride, self.stride + 1, self.stride - 1)  # E, S, SE and SW directions
+
+        self.win_lines = get_win_lines(M, N, k_in_row)       # Lines through each move
+        self.all_lines = get_all_win_lines(M, N, k_in_row)   # All lines
+        self.scan_lines = len(self.all_lines) <= LINE_SCAN_LIMIT * k_in_row
+
+        self.symmetries = get_symmetries(M, N)
+        self.symmetry_tables = get_symmetry_tables(M, N)
+        self.search_order = get_search_order(M, N)
+
 
 """
 Class to represent a board state for an m,n,k-game
@@ -13,46 +49,88 @@ Class to represent a board state for an m,n,k-game
 class Board:
     """
     Each board cell is represented with a position bit and mask bit.
-    Integers position and mask are M*N bits. The key = position + mask is M*N+1 bits.
+    Each row has an extra padding bit which is never set, so a line of bits 
+    shifted along a row or diagonal cannot wrap onto the next row.
+    Integers position and mask are (M+1)*N bits. The key = mask << (M+1)*N | position 
+    is 2*(M+1)*N bits and is unique for each board state.
     
-    Bit order      Board          Position       Mask        
-     0  1  2  3    .  X  .  O     0  1  0  0     0  1  0  1     
-     4  5  6  7    .  .  X  .     0  0  1  0     0  0  1  0 
-     8  9 10 11    .  O  .  .     0  0  0  0     0  1  0  0 
-    12 13 14 15    .  .  .  .     0  0  0  0     0  0  0  0 
+    Bit order         Board          Position         Mask        
+     0  1  2  3  4    .  X  .  O     0  1  0  0 0     0  1  0  1 0
+     5  6  7  8  9    .  .  X  .     0  0  1  0 0     0  0  1  0 0
+    10 11 12 13 14    .  O  .  .     0  0  0  0 0     0  1  0  0 0
+    15 16 17 18 19    .  .  .  .     0  0  0  0 0     0  0  0  0 0
 
+    Moves are bit indices. A cell numbered r*M + c maps to move r*(M+1) + c.
+
+    A board state only holds its position, mask and moves. Everything derived
+    from the board size is in its shared Geometry.
     """
+    __slots__ = ('geometry', 'tokens', 'position', 'mask', 'moves')
 
     def __init__(self, tokens = ('X', 'O'), 
                  M = 3, N = 3, k_in_row = 3, 
-                 position=np.uint(0), mask=np.uint(0), moves=0):
-        self.tokens = tokens         # The symbols for the players
-        self.M = M                   # Board of m width
-        self.N = N                   # Board of n height
-        self.k_in_row = k_in_row     # Require k tokens in a line to win
-
-        # TODO: Optimise solver to handle larger cases.
-        assert 2 < self.M <= 6 and 2 < self.N <= 6, 'M and N too large'
-        assert self.k_in_row <= self.M and self.k_in_row <= self.N, 'k_in_row too large'
-
+                 position=0, mask=0, moves=0):
+        self.geometry = _geometries.get((M, N, k_in_row)) or get_geometry(M, N, k_in_row)
+        self.tokens = tokens      # The symbols for the players
         self.position = position  # encoding of pieces for the current player
         self.mask = mask          # encoding of all pieces played
         self.moves = moves        # number of moves played
-        
-        self.min_score = -(self.M * self.N) // 2 + 3
-        self.max_score = (self.M * self.N + 1) // 2 - 3
 
-    def is_valid_move(self, move: np.uint) -> bool:
+    # The values of the board size, from the geometry.
+    M = property(lambda self: self.geometry.M)
+    N = property(lambda self: self.geometry.N)
+    k_in_row = property(lambda self: self.geometry.k_in_row)
+    cells = property(lambda self: self.geometry.cells)
+    min_score = property(lambda self: self.geometry.min_score)
+    max_score = property(lambda self: self.geometry.max_score)
+    stride = property(lambda self: self.geometry.stride)
+    bits = property(lambda self: self.geometry.bits)
+    board_mask = property(lambda self: self.geometry.board_mask)
+    all_lines = property(lambda self: self.geometry.all_lines)
+
+    def copy(self):
+        """
+        Returns a copy of the board state.
+        :return: the copy
+        """
+        board_copy = Board.__new__(Board)
+        board_copy.geometry = self.geometry
+        board_copy.tokens = self.tokens
+        board_copy.position = self.position
+        board_copy.mask = self.mask
+        board_copy.moves = self.moves
+        return board_copy
+
+    def is_valid_move(self, move: int) -> bool:
         """
         Checks if the move is valid.
         :param move: the move to play
         :return:     if the move is valid
         """
-        if 0 <= move < self.M * self.N and self.mask & (1 << move) == 0:
+        geometry = self.geometry
+        if 0 <= move < geometry.bits and (geometry.board_mask & ~self.mask) >> move & 1:
             return True
         return False
 
-    def play(self, move: np.uint):
+    def cell_to_move(self, cell: int) -> int:
+        """
+        Converts a cell number r*M + c to the move of its bit.
+        :param cell: the cell number
+        :return:     the move of the cell
+        """
+        M = self.geometry.M
+        return cell // M * (M + 1) + cell % M
+
+    def move_to_cell(self, move: int) -> int:
+        """
+        Converts a move to its cell number r*M + c.
+        :param move: the move
+        :return:     the cell number of the move
+        """
+        M = self.geometry.M
+        return move // (M + 1) * M + move % (M + 1)
+
+    def play(self, move: int):
         """
         Plays a move.
         :param move: the move to play
@@ -61,6 +139,15 @@ class Board:
         self.mask |= 1 << move
         self.moves += 1
 
+    def undo(self, move: int):
+        """
+        Undoes the last move played.
+        :param move: the last move played
+        """
+        self.mask ^= 1 << move
+        self.position ^= self.mask
+        self.moves -= 1
+
     def play_sequence(self, moves: list) -> int:
         """
         Plays a sequence of moves.
@@ -73,76 +160,39 @@ class Board:
             self.play(move)
         return len(moves)
     
-    def is_winning_move(self, move: np.uint) -> bool:
+    def is_winning_move(self, move: int) -> bool:
         """
         Checks whether the move is a winning move.
         :param move: the move to check
         :return:     if the move is a winning move
         """
         # Check next_pos if move is played. 
-        next_pos = self.position
-        next_pos |= 1 << move
-        # print(f'next: {next_pos:0{self.M*N}b}')
+        next_pos = self.position | 1 << move
 
-        # Check the row of the token played for winning.
-        # A winning row will have k-in-a-row bits set.
+        # A winning line has all k-in-a-row bits of its mask set.
         # E.g. 4,3,3-game: 0000 1110 0000 wins
-        # check_r is the checking mask for k-in-a-row bits set:
-        check_r = (1 << self.k_in_row) - 1
-        for shift in range(0, self.M - self.k_in_row + 1):
-            # shift will check all positions within a row: 
-            # E.g. 5,5,3-game: 11100 -> 01110 -> 00111
-            shift_r = next_pos >> (move // self.M * self.M) + shift
-            if check_r & shift_r == check_r:
+        for line in self.geometry.win_lines[move]:
+            if next_pos & line == line:
                 return True
-        
-        # Check the col of the token played for winning.
-        # check_c is the checking mask for bits set at indices move % M:
-        # E.g. 4,3,3-game: 0100 0100 0100 wins
-        check_c = 1 << (move % self.M) 
-        for _ in range(self.k_in_row-1):
-            check_c <<= self.M
-            check_c |= 1 << (move % self.M) 
-
-        for shift in range(0, self.N - self.k_in_row + 1):
-            shift_c = next_pos >> (shift * self.M)
-            # shift next_pos by M bits until there is a match with check_c: 
-            if check_c & shift_c == check_c:
-                return True
-
-
-        # TODO: Implement bitwise checking for diagonals.
-            
-        # Check diagonal NW-SE direction
-        d1 = [(move // self.M + i) * self.M + move % self.M + i 
-              if (0 <= (move // self.M + i) < self.N and 0 <= (move % self.M + i) < self.M) 
-              else -1 
-              for i in range(-self.k_in_row + 1, self.k_in_row)]
-
-        for i in range(len(d1) - self.k_in_row + 1):
-            check_d1 = 0
-            if d1[i] != -1 and d1[i+self.k_in_row-1] != -1:
-                for j in range(self.k_in_row):
-                    check_d1 |= 1 << d1[i+j]
-                if check_d1 & next_pos == check_d1:
-                    return True
-
-        # Check diagonal NE-SW direction
-        d2 = [(move // self.M + i) * self.M + move % self.M - i 
-              if (0 <= (move // self.M + i) < self.N and 0 <= (move % self.M - i) < self.M) 
-              else -1 
-              for i in range(-self.k_in_row + 1, self.k_in_row)]
-
-        for i in range(len(d2) - self.k_in_row + 1):
-            check_d2 = 0
-            if d2[i] != -1 and d2[i+self.k_in_row-1] != -1:
-                for j in range(self.k_in_row):
-                    check_d2 |= 1 << d2[i+j]
-                if check_d2 & next_pos == check_d2:
-                    return True
 
         return False
 
+    def get_score_range(self) -> tuple:
+        """
+        Returns the range of possible scores for the current player. The score 
+        is at worst a loss on the next move of the other player and at best a
+        win on the next move, limited by the fastest win of each player.
+        :return: (min score, max score) of the board state
+        """
+        geometry = self.geometry
+        empty_cells = geometry.cells - self.moves
+        if self.moves % 2 == 0:
+            min_score, max_score = geometry.min_score, geometry.max_score
+        else:
+            min_score, max_score = -geometry.max_score, -geometry.min_score
+        return (max(min_score, -(empty_cells // 2)),
+                min(max_score, (empty_cells + 1) // 2))
+
     def get_num_moves(self) -> int:
         """
         Returns the number of moves played.
@@ -150,32 +200,261 @@ class Board:
         """
         return self.moves
     
-    def key(self) -> np.uint:
+    def key(self) -> int:
         """
-        Returns the key for the board state. key = position + mask.
+        Returns the key for the board state. key = mask << (M+1)*N | position.
+        Unlike position + mask, the key does not collide for different board 
+        states as the stones of a row are not necessarily contiguous.
         :return: the key for the board state
         """
-        return self.position + self.mask
+        return self.mask << self.geometry.bits | self.position
+
+    def winning_cells(self, bits: int) -> int:
+        """
+        Returns the cells which would complete k tokens in a line with the bits.
+        Occupied cells are not removed.
+        On boards with few lines, each line with k-1 tokens adds its missing cell.
+        Otherwise, for each direction, a cell is winning if it has j tokens in a 
+        line on one side and k-1-j on the other. Runs of tokens on each side are 
+        found with shift-and-AND, which does not grow with the board size.
+        :param bits: the bits of the tokens of a player
+        :return:     the mask of winning cells
+        """
+        geometry = self.geometry
+        k_in_row = geometry.k_in_row
+        winning = 0
+        if geometry.scan_lines:
+            for line in geometry.all_lines:
+                line_bits = line & bits
+                if line_bits.bit_count() == k_in_row - 1:
+                    winning |= line ^ line_bits
+            return winning
+
+        for shift in geometry.shifts:
+            # before[j] marks cells with j tokens in a line before the cell, after[j] after it.
+            before, after = [-1], [-1]
+            for j in range(1, k_in_row):
+                before.append(before[-1] & bits << (j * shift))
+                after.append(after[-1] & bits >> (j * shift))
+            for j in range(k_in_row):
+                winning |= before[j] & after[k_in_row - 1 - j]
+        return winning & geometry.board_mask
 
     def get_symmetric_states(self) -> set:
-        sym = set()
-        str_position = f'{self.position:0{self.M*self.N}b}'
-        str_mask = f'{self.mask:0{self.M*self.N}b}'
+        """
+        Returns the keys of the board state under each symmetry of the board.
+        :return: set of keys of the symmetric board states
+        """
+        return set(self.symmetric_keys())
+
+    def symmetric_keys(self) -> list:
+        """
+        Returns the key of the board state transformed by each symmetry of the
+        board, in the order of the symmetry permutations. The first key is the
+        identity i.e. the key of the board state.
+        :return: list of keys of the symmetric board states
+        """
+        key = self.mask << self.geometry.bits | self.position
+        keys = []
+        for chunk_tables in self.geometry.symmetry_tables:
+            sym_key = 0
+            k = key
+            for table in chunk_tables:
+                if not k:
+                    break
+                sym_key |= table[k & 0xFF]
+                k >>= 8
+            keys.append(sym_key)
+        return keys
+
+    def canonical_key(self) -> int:
+        """
+        Returns the minimal key over all symmetric board states. Symmetric 
+        board states share a canonical key and have the same score.
+        :return: the canonical key for the board state
+        """
+        return min(self.symmetric_keys())
+
+
+def get_geometry(M: int, N: int, k_in_row: int) -> Geometry:
+    """
+    Returns the geometry of a board size, created on first use.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :return:         the geometry shared by the board states of the size
+    """
+    if (M, N, k_in_row) not in _geometries:
+        _geometries[(M, N, k_in_row)] = Geometry(M, N, k_in_row)
+    return _geometries[(M, N, k_in_row)]
+
+
+def get_board_mask(M: int, N: int) -> int:
+    """
+    Returns the mask of the bits of all cells of an M by N board, excluding 
+    the padding bits.
+    :param M: the board width
+    :param N: the board height
+    :return:  the mask of all cells
+    """
+    row_mask = (1 << M) - 1
+    board_mask = 0
+    for r in range(N):
+        board_mask |= row_mask << r * (M + 1)
+    return board_mask
+
+
+def get_win_lines(M: int, N: int, k_in_row: int) -> list:
+    """
+    Returns the masks of the k-in-a-row lines through each cell of an M by N 
+    board. The lines are rows, columns and both diagonals.
+    E.g. 4,3,3-game lines through cell 5 (excluding padding bits): 
+    0000 1110 0000, 0000 0111 0000, 0100 0100 0100, 
+    1000 0100 0010, 0010 0100 1000
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :return:         list of line masks for each move
+    """
+    if (M, N, k_in_row) not in _win_lines:
+        lines = [[] for _ in range((M + 1) * N)]
+        # Lines start at a cell and run E, S, SE or SW.
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for r in range(N):
+                for c in range(M):
+                    end_r, end_c = r + (k_in_row - 1) * dr, c + (k_in_row - 1) * dc
+                    if not (0 <= end_r < N and 0 <= end_c < M):
+                        continue
+                    cells = [(r + i * dr) * (M + 1) + c + i * dc for i in range(k_in_row)]
+                    line = 0
+                    for cell in cells:
+                        line |= 1 << cell
+                    for cell in cells:
+                        lines[cell].append(line)
+        _win_lines[(M, N, k_in_row)] = lines
+    return _win_lines[(M, N, k_in_row)]
+
+
+def get_all_win_lines(M: int, N: int, k_in_row: int) -> list:
+    """
+    Returns the masks of all k-in-a-row lines of an M by N board.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :return:         sorted list of line masks
+    """
+    if (M, N, k_in_row) not in _all_win_lines:
+        _all_win_lines[(M, N, k_in_row)] = sorted({line for lines in get_win_lines(M, N, k_in_row) 
+                                                   for line in lines})
+    return _all_win_lines[(M, N, k_in_row)]
 
-        # Get horizontal reflection
-        pos_h_reflect = ''.join(reversed([str_position[i:i+self.M] for i in range(0, len(str_position), self.M)]))
-        mask_h_reflect = ''.join(reversed([str_mask[i:i+self.M] for i in range(0, len(str_mask), self.M)]))
-        sym.add(int(pos_h_reflect) + int(mask_h_reflect))
 
-        # Get 180deg rotation
-        pos_180_rot = int(str_position[::-1],2)
-        mask_180_rot = int(str_mask[::-1],2)
-        sym.add(pos_180_rot + mask_180_rot)
+def get_symmetries(M: int, N: int) -> list:
+    """
+    Returns the cell permutations of the symmetries of an M by N board. A square
+    board has the 8 rotations and reflections of the dihedral group and a 
+    rectangular board has 4. Each permutation maps a move to its transformed move,
+    padding bits are mapped onto themselves.
+    :param M: the board width
+    :param N: the board height
+    :return:  list of permutations, the identity first
+    """
+    if (M, N) not in _symmetries:
+        transforms = [lambda r, c: (r, c),                  # Identity
+                      lambda r, c: (r, M - 1 - c),          # Horizontal reflection
+                      lambda r, c: (N - 1 - r, c),          # Vertical reflection
+                      lambda r, c: (N - 1 - r, M - 1 - c)]  # 180deg rotation
+        if M == N:
+            transforms += [lambda r, c: (c, r),                  # Main diagonal reflection
+                           lambda r, c: (M - 1 - c, N - 1 - r),  # Anti-diagonal reflection
+                           lambda r, c: (c, N - 1 - r),          # 90deg rotation
+                           lambda r, c: (M - 1 - c, r)]          # 270deg rotation
+
+        perms = []
+        for transform in transforms:
+            perm = list(range((M + 1) * N))
+            for r in range(N):
+                for c in range(M):
+                    tr, tc = transform(r, c)
+                    perm[r * (M + 1) + c] = tr * (M + 1) + tc
+            perms.append(perm)
+        _symmetries[(M, N)] = perms
+    return _symmetries[(M, N)]
+
+
+def get_symmetry_tables(M: int, N: int) -> list:
+    """
+    Returns the lookup tables to transform a key by each symmetry of an M by N
+    board. The key is split into bytes and each byte is looked up in the table
+    of its chunk, giving the transformed bits which are OR-ed together.
+    :param M: the board width
+    :param N: the board height
+    :return:  list of chunk tables for each symmetry, the identity first
+    """
+    if (M, N) not in _symmetry_tables:
+        bits = (M + 1) * N
+        key_bits = 2 * bits
+        sym_tables = []
+        for perm in get_symmetries(M, N):
+            # The position and the mask halves of the key are permuted alike.
+            key_perm = perm + [bits + p for p in perm]
+            chunk_tables = []
+            for chunk in range(0, key_bits, 8):
+                # Each value is the value without its lowest bit, plus that bit transformed.
+                table = [0] * 256
+                for value in range(1, 256):
+                    bit = (value & -value).bit_length() - 1
+                    moved = 1 << key_perm[chunk + bit] if chunk + bit < key_bits else 0
+                    table[value] = table[value & (value - 1)] | moved
+                chunk_tables.append(table)
+            sym_tables.append(chunk_tables)
+        _symmetry_tables[(M, N)] = sym_tables
+    return _symmetry_tables[(M, N)]
+
+
+def get_search_order(M: int, N: int) -> list:
+    """
+    Generate the search order starting from the centre and spiralling 
+    outwards clockwise. The theory is that moves played near the centre 
+    have more impactful branches which will create more opportunities for 
+    alpha-beta pruning.
+    :param M: the board width
+    :param N: the board height
+    :return:  the moves in search order
+    """
+    rows, cols = N, M
+    board = [[r * (M + 1) + c for c in range(cols)] for r in range(rows)]              
+
+    top, bottom, left, right = 0, rows-1, 0, cols-1
+    result = []
+    
+    while len(result) < rows * cols:
+        for i in range(left, right+1):
+            result.append(board[top][i])
+        top += 1
+        
+        for i in range(top, bottom+1):
+            result.append(board[i][right])
+        right -= 1
+        
+        if top <= bottom:
+            for i in range(right, left-1, -1):
+                result.append(board[bottom][i])
+            bottom -= 1
+        
+        if left <= right:
+            for i in range(bottom, top-1, -1):
+                result.append(board[i][left])
+            left += 1
 
-        # print(f'pos: {pos:0{self.M*self.N}b}', f'mask: {mask:0{self.M*self.N}b}')
-        return sym
+    return list(reversed(result))
 
 
+_geometries = {}
+_win_lines = {}
+_all_win_lines = {}
+_symmetries = {}
+_symmetry_tables = {}
 
 
 """
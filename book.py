@@ -0,0 +1,153 @@
+"""
+Alson Lee
+Date: 15/03/24
+
+The book module contains the opening book of solved early board states for an m,n,k-game.
+
+Usage: python book.py M N k_in_row depth [path]
+"""
+
+import board
+import solver
+
+import mmap
+import struct
+import sys
+import timeit
+
+"""
+Book file format. All integers are big-endian.
+
+Header      magic 'MNKB', version, M, N, k_in_row, depth, key bytes, number of records
+Records     canonical key (key bytes), score (signed 16-bit)
+
+Records are sorted by key so a key is found by binary search. Keys of equal
+width compare in the same order as bytes and as integers.
+"""
+MAGIC = b'MNKB'
+VERSION = 1
+HEADER = struct.Struct('>4sBHHHHHI')
+SCORE = struct.Struct('>h')
+
+
+def get_book_path(M: int, N: int, k_in_row: int) -> str:
+    """
+    Returns the default path of the book for a board size.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :return:         the path of the book
+    """
+    return f'book_{M}x{N}x{k_in_row}.bin'
+
+
+def generate_book(M: int, N: int, k_in_row: int, depth: int, path: str, **solver_options) -> int:
+    """
+    Solves every board state reachable in up to depth moves and writes the
+    scores to a book file. Symmetric board states are stored once by their
+    canonical key and board states which have been won are not stored.
+    :param M:              the board width
+    :param N:              the board height
+    :param k_in_row:       the tokens in a row to win
+    :param depth:          the max number of moves played of the board states
+    :param path:           the path of the book file
+    :param solver_options: the options of the solver
+    :return:               the number of board states stored
+    """
+    default_board = board.Board(M=M, N=N, k_in_row=k_in_row)
+    solve = solver.Solver(default_board, **solver_options)
+
+    # Expand the board states one move at a time, keeping one board state per canonical key.
+    level = {default_board.canonical_key(): default_board}
+    scores = {}
+    for moves in range(min(depth, M * N) + 1):
+        next_level = {}
+        for key, board_state in level.items():
+            scores[key] = solve.solve(board_state)
+            if moves == depth:
+                continue
+            for move in solve.search_order:
+                if board_state.is_valid_move(move) and not board_state.is_winning_move(move):
+                    next_state = board_state.copy()
+                    next_state.play(move)
+                    next_level.setdefault(next_state.canonical_key(), next_state)
+        level = next_level
+
+    key_bytes = (2 * default_board.bits + 7) // 8
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, M, N, k_in_row, depth, key_bytes, len(scores)))
+        for key in sorted(scores):
+            f.write(key.to_bytes(key_bytes, 'big'))
+            f.write(SCORE.pack(scores[key]))
+
+    return len(scores)
+
+
+"""
+Class to look up scores of board states in a book file.
+"""
+class OpeningBook:
+    """
+    The book file is memory-mapped, so opening a book does not read or parse
+    the records and a lookup is a binary search of O(log n) record reads.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.M, self.N, self.k_in_row, self.depth, self.key_bytes, self.size = \
+            HEADER.unpack_from(self.mmap, 0)
+        assert magic == MAGIC and version == VERSION, 'not a book file'
+
+        self.record_bytes = self.key_bytes + SCORE.size
+
+    def get(self, board_inst: board.Board):
+        """
+        Gets the score of a board state.
+        :param board_inst: the board instance to look up
+        :return:           the score, None if the board state is not in the book
+        """
+        if (board_inst.get_num_moves() > self.depth
+                or (board_inst.M, board_inst.N, board_inst.k_in_row) != (self.M, self.N, self.k_in_row)):
+            return None
+
+        key = board_inst.canonical_key().to_bytes(self.key_bytes, 'big')
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * self.record_bytes
+            record_key = self.mmap[offset:offset + self.key_bytes]
+            if record_key < key:
+                lo = mid + 1
+            elif record_key > key:
+                hi = mid
+            else:
+                return SCORE.unpack_from(self.mmap, offset + self.key_bytes)[0]
+        return None
+
+    def close(self):
+        """
+        Closes the memory-mapped book file.
+        """
+        self.mmap.close()
+
+
+def main():
+    if len(sys.argv) not in (5, 6):
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    M, N, k_in_row, depth = (int(arg) for arg in sys.argv[1:5])
+    path = sys.argv[5] if len(sys.argv) == 6 else get_book_path(M, N, k_in_row)
+
+    start = timeit.default_timer()
+    size = generate_book(M, N, k_in_row, depth, path)
+    end = timeit.default_timer()
+
+    print(f'Solved {size} board states up to {depth} moves in {end - start:.2f}s')
+    print(f'Book written to {path}')
+
+
+if __name__ == '__main__':
+    main()
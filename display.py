@@ -27,8 +27,8 @@ def print_board_state(board_state: board.Board):
     Prints a board state.
     :param board_state: the board state
     """
-    curr_player = f'{board_state.position:0{board_state.M*board_state.N}b}'
-    next_player = f'{board_state.position^board_state.mask:0{board_state.M*board_state.N}b}'
+    curr_player = board_state.position
+    next_player = board_state.position ^ board_state.mask
 
     if board_state.get_num_moves() % 2 == 0:
         P1, P2 = curr_player, next_player # P1 on even turns
@@ -38,9 +38,10 @@ def print_board_state(board_state: board.Board):
     print('Board')
     for r in range(board_state.N):
         for c in range(board_state.M):
-            if P1[-(r * board_state.M + c + 1)] == '1':
+            move = r * board_state.stride + c
+            if P1 >> move & 1:
                 print(f'{board_state.tokens[0]:>{LPAD}}', end='')
-            elif P2[-(r * board_state.M + c + 1)] == '1':
+            elif P2 >> move & 1:
                 print(f'{board_state.tokens[1]:>{LPAD}}', end='')
             else:
                 print(f'{".":>{LPAD}}', end='')
@@ -62,16 +63,19 @@ def print_board_score(board_state: board.Board, move_scores: list):
                 scores.add(move_scores[y][x])
     
     best_move = max(scores)
+    # Evaluations of a depth-limited search are printed with 2 decimals.
+    pad = LPAD + 3 if any(isinstance(score, float) for score in scores) else LPAD
 
     print(f'Move scores for Player {player}')
     for y in range(board_state.N):
         for x in range(board_state.M):
             score = move_scores[y][x]
             if score is None:
-                print(f'{".":>{LPAD}}', end='')
+                print(f'{".":>{pad}}', end='')
             else:
-                fscore = score if score != best_move else '*' + str(score)
-                print(f'{fscore:>{LPAD}}', end='')
+                fscore = f'{score:.2f}' if isinstance(score, float) else str(score)
+                fscore = fscore if score != best_move else '*' + fscore
+                print(f'{fscore:>{pad}}', end='')
         print()
     print()
 
@@ -102,14 +106,41 @@ def print_divider():
     print('-' * MAX_DISPLAY_WIDTH)
 
 
-def print_solve_stats(search_nodes: int, solve_time: float):
+def print_solve_stats(search_nodes: int, solve_time: float, search_depth: int = None):
     """
     Prints the solving stats.
     :param search_nodes: number of nodes explored
     :param solve_time:   the time to solve
+    :param search_depth: the depth of a depth-limited search, None if solved exactly
     """
     print(f'Searched nodes: {search_nodes}',
           f'Solve time:     {solve_time * 1000:.2f}ms',
+          sep='\n')
+    if search_depth is not None:
+        print(f'Search depth:   {search_depth} (scores between -1 and 1 are estimates)')
+    print()
+
+
+def print_mcts_stats(playouts: int, solve_time: float):
+    """
+    Prints the Monte Carlo tree search stats.
+    :param playouts:   number of playouts
+    :param solve_time: the time to search
+    """
+    print(f'Playouts:       {playouts} ({playouts / solve_time:,.0f}/s)',
+          f'Search time:    {solve_time * 1000:.2f}ms',
+          '(scores between -1 and 1 are mean playout results)',
+          sep='\n', end='\n\n')
+
+
+def print_startup_stats(import_time: float, init_time: float):
+    """
+    Prints the time to start up a one-shot query.
+    :param import_time: the time to import the modules of the board and display
+    :param init_time:   the time to import the modules of the solver and create it
+    """
+    print(f'Import time:    {import_time * 1000:.2f}ms',
+          f'Init time:      {init_time * 1000:.2f}ms',
           sep='\n', end='\n\n')
 
 
@@ -3,13 +3,16 @@ Alson Lee
 Date: 15/03/24
 
 Simple AI using negamax algorithm to solve m,n,k-games
-"""
 
-import board
-import display
-import solver
-import validation
+With no arguments, plays a game with the settings below. With arguments, solves
+the board state after the cells played (numbered from 1 as displayed), prints
+the move scores and exits.
+
+Usage: python main.py [M N k_in_row [cell ...]]
+"""
 
+import os
+import sys
 import timeit
 
 """
@@ -18,11 +21,136 @@ GAME SETTINGS
 BOARD_WIDTH = 4   # Set the board width
 BOARD_HEIGHT = 4  # Set the board height
 K_IN_A_ROW = 4    # Set number of tokens in a row to win
+SOLVER_WORKERS = 1  # Set number of processes to solve moves in parallel
+SOLVER_DEPTH_LIMIT = None  # Set max moves to search ahead, None to solve exactly
+SOLVER_TIME_LIMIT = None   # Set max seconds to search each turn e.g. 0.9 for 6x6 boards, None to solve exactly
+USE_MCTS = False           # Set to use Monte Carlo tree search e.g. for 7x7 boards and up
+MCTS_TIME_LIMIT = 1.0      # Set seconds of playouts each turn with MCTS
+USE_BOOK = True            # Set to use the opening book of the board size if it exists, see book.py
+USE_TABLEBASE = True       # Set to use the tablebase of the board size if it exists, see tablebase.py
+
+"""
+The modules of the solver are imported by the functions which use them, so a
+one-shot query does not pay for modules it never uses, e.g. mcts and the
+process pools of parallel solving.
+"""
+
+
+def create_solver(board_state):
+    """
+    Creates the solver of the settings for a board, with the opening book and
+    tablebase of its size if they exist.
+    :param board_state: the default board of the solver
+    :return:            (solver, opening book or None, tablebase or None)
+    """
+    if USE_MCTS:
+        import mcts
+        return mcts.MCTSSolver(board_state, time_limit=MCTS_TIME_LIMIT, workers=SOLVER_WORKERS), None, None
+
+    import book
+    import solver
+    import tablebase
+    import transposition
+
+    M, N, k_in_row = board_state.M, board_state.N, board_state.k_in_row
+    book_path = book.get_book_path(M, N, k_in_row)
+    tablebase_path = tablebase.get_tablebase_path(M, N, k_in_row)
+    opening_book = book.OpeningBook(book_path) if USE_BOOK and os.path.exists(book_path) else None
+    endgame_table = tablebase.Tablebase(tablebase_path) if USE_TABLEBASE and os.path.exists(tablebase_path) else None
+
+    # A board has fewer than 3^cells board states, so small boards need a smaller table.
+    tt_size = min(transposition.TranspositionTable.DEFAULT_SIZE, 3 ** board_state.cells)
+    solve = solver.Solver(board_state, tt_size=tt_size, workers=SOLVER_WORKERS,
+                          book=opening_book, tablebase=endgame_table,
+                          depth_limit=SOLVER_DEPTH_LIMIT, time_limit=SOLVER_TIME_LIMIT)
+    return solve, opening_book, endgame_table
+
+
+def close_solver(solve, opening_book, endgame_table):
+    """
+    Closes a solver and its opening book and tablebase.
+    :param solve:         the solver
+    :param opening_book:  the opening book, None if not used
+    :param endgame_table: the tablebase, None if not used
+    """
+    solve.close()
+    if opening_book is not None:
+        opening_book.close()
+    if endgame_table is not None:
+        endgame_table.close()
+
+
+def print_stats(solve, search_nodes: int, solve_time: float):
+    """
+    Prints the stats of the solver after a solve.
+    :param solve:        the solver
+    :param search_nodes: the nodes or playouts searched
+    :param solve_time:   the time to solve
+    """
+    import display
+
+    if USE_MCTS:
+        display.print_mcts_stats(search_nodes, solve_time)
+    else:
+        display.print_solve_stats(search_nodes, solve_time,
+                                  solve.searched_depth if solve.horizon_reached else None)
+
+
+def query(M: int, N: int, k_in_row: int, cells: list):
+    """
+    Solves one board state without input and prints its move scores, with the
+    time to import the modules of the solver and to create it.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :param cells:    the cells played, numbered from 1
+    """
+    import_start = timeit.default_timer()
+    import board
+    import display
+    import_end = timeit.default_timer()
+
+    if not (2 < M and 2 < N and k_in_row <= min(M, N)):
+        print(f'{M}x{N}x{k_in_row} is not a valid board size, M and N must be over 2 and k_in_row at most M and N')
+        sys.exit(1)
+    board_state = board.Board(M=M, N=N, k_in_row=k_in_row)
+    for cell in cells:
+        move = board_state.cell_to_move(cell - 1) if 0 < cell <= board_state.cells else None
+        if move is None or not board_state.is_valid_move(move):
+            print(f'Cell {cell} is not an empty cell between (1-{board_state.cells})')
+            sys.exit(1)
+        if board_state.is_winning_move(move):
+            print(f'Cell {cell} wins the game, there is nothing to solve')
+            sys.exit(1)
+        board_state.play(move)
+    if board_state.get_num_moves() == board_state.cells:
+        print('The board is full, there is nothing to solve')
+        sys.exit(1)
+
+    # Modules imported by create_solver count towards its time.
+    init_start = timeit.default_timer()
+    solve, opening_book, endgame_table = create_solver(board_state)
+    init_end = timeit.default_timer()
+
+    move_scores = solve.solve_score_each(board_state)
+    solve_end = timeit.default_timer()
+
+    display.print_board_state(board_state)
+    display.print_board_score(board_state, move_scores)
+    print_stats(solve, solve.get_node_count(), solve_end - init_end)
+    display.print_startup_stats(import_end - import_start, init_end - init_start)
+
+    close_solver(solve, opening_book, endgame_table)
+
 
 def main():
+    import board
+    import display
+    import validation
+
     # Instantiate board and solver for the board
     board_state = board.Board(N=BOARD_WIDTH, M=BOARD_HEIGHT, k_in_row=K_IN_A_ROW)
-    solve = solver.Solver(board_state)
+    solve, opening_book, endgame_table = create_solver(board_state)
     curr_move = 0
 
     # Game and solver loop
@@ -47,18 +175,18 @@ def main():
         display.print_board_cells(board_state)
         display.print_board_state(board_state)
         display.print_board_score(board_state, move_scores)
-        display.print_solve_stats(solve_stats, solve_end - solve_start)
+        print_stats(solve, solve_stats, solve_end - solve_start)
         solve.reset_node_count()
 
         display.print_score_explanation(board_state)
         
-        move = 1
         while True:
-            print(f'Which board cell to play? Enter a cell between (0-{board_cells}):')
+            print(f'Which board cell to play? Enter an empty cell between (1-{board_cells}):')
             inp = input(' >>> ')
-            if validation.is_valid_input(inp) and 0 < move <= board_cells:
-                move = int(inp) - 1
-                break
+            if validation.is_valid_input(inp) and 0 < int(inp) <= board_cells:
+                move = board_state.cell_to_move(int(inp) - 1)
+                if board_state.is_valid_move(move):
+                    break
 
         # Check win
         if board_state.is_winning_move(move):
@@ -74,5 +202,13 @@ def main():
         display.print_board_state(board_state)
         display.draw_message()
 
+    close_solver(solve, opening_book, endgame_table)
+
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) == 1:
+        main()
+    elif len(sys.argv) >= 4 and all(arg.isnumeric() for arg in sys.argv[1:]):
+        query(*(int(arg) for arg in sys.argv[1:4]), [int(arg) for arg in sys.argv[4:]])
+    else:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
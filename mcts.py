@@ -0,0 +1,318 @@
+"""
+Alson Lee
+Date: 15/03/24
+
+The mcts module contains a Monte Carlo tree search player for m,n,k-games which
+are too large to solve.
+"""
+
+import board
+
+import concurrent.futures
+import math
+import random
+import timeit
+
+
+"""
+Node class of the search tree of the MCTSSolver.
+"""
+class Node:
+    """
+    The value of a node is the sum of the playout results for the player who
+    played the move of the node: 1 for a win, 0 for a draw, -1 for a loss.
+    """
+
+    def __init__(self, move: int = None, moves: list = None, won: bool = False):
+        self.move = move          # The move played to reach the node
+        self.children = {}        # Child nodes by move
+        self.untried = moves      # Valid moves without a child node yet
+        self.won = won            # If the move of the node won the game
+        self.visits = 0
+        self.value = 0
+
+    def select_child(self, exploration: float):
+        """
+        Selects the child with the highest upper confidence bound (UCT).
+        :param exploration: the exploration constant
+        :return:            the selected child node
+        """
+        log_visits = math.log(self.visits)
+        return max(self.children.values(),
+                   key=lambda child: child.value / child.visits
+                   + exploration * math.sqrt(log_visits / child.visits))
+
+
+"""
+MCTSSolver class which implements Monte Carlo tree search with UCT for an m,n,k-game.
+"""
+class MCTSSolver:
+    """
+    Scores are the mean playout result of each move for the current player,
+    between -1 and 1, except an immediate win which has the score of the
+    Solver. The tree is kept between turns, so the search continues from the
+    subtree of the moves played since.
+    """
+
+    def __init__(self, default_board, time_limit=1.0, playouts=None, exploration=1.4,
+                 workers=1, seed=None):
+        assert time_limit is not None or playouts is not None, 'a time limit or playouts is required'
+        assert workers > 0, 'workers must be positive'
+
+        self.default_board = default_board
+        self.time_limit = time_limit    # Max seconds to search each turn
+        self.playouts = playouts        # Max playouts each turn
+        self.exploration = exploration  # UCT exploration constant
+        self.workers = workers          # Number of processes to search in parallel
+        self.pool = None
+        self.rng = random.Random(seed)
+
+        self.root = None                # Root node of the tree
+        self.root_state = None          # (position, mask, moves) of the root node
+        self.playout_count = 0
+        self.search_time = 0
+
+        self.score_each = [[0 for _ in range(self.default_board.M)]
+                           for _ in range(self.default_board.N)]
+
+    def solve_score_each(self, board_inst: board.Board):
+        """
+        Searches all valid moves and returns the score of each of the valid
+        moves in matrix form.
+        :param board_inst: the board instance being searched
+        :return:           score matrix of each valid move
+        """
+        if self.workers > 1:
+            stats = self.search_parallel(board_inst)
+        else:
+            root = self.search(board_inst)
+            stats = {move: (child.visits, child.value) for move, child in root.children.items()}
+
+        for r in range(board_inst.N):
+            for c in range(board_inst.M):
+                move = r * board_inst.stride + c
+                if not board_inst.is_valid_move(move):
+                    self.score_each[r][c] = None
+                elif board_inst.is_winning_move(move):
+                    self.score_each[r][c] = (board_inst.M * board_inst.N - board_inst.get_num_moves() + 1) // 2
+                else:
+                    visits, value = stats.get(move, (0, 0))
+                    self.score_each[r][c] = value / visits if visits else 0.0
+
+        return self.score_each
+
+    def search(self, board_inst: board.Board) -> Node:
+        """
+        Runs playouts from a board state until the time limit or the number
+        of playouts is reached.
+        :param board_inst: the board instance being searched
+        :return:           the root node of the tree
+        """
+        root = self.get_root(board_inst)
+        search_board = board.Board(M=board_inst.M, N=board_inst.N, k_in_row=board_inst.k_in_row)
+
+        start = timeit.default_timer()
+        deadline = start + self.time_limit if self.time_limit is not None else None
+        playouts = 0
+        while ((self.playouts is None or playouts < self.playouts)
+               and (deadline is None or timeit.default_timer() < deadline)):
+            search_board.position, search_board.mask, search_board.moves = \
+                board_inst.position, board_inst.mask, board_inst.moves
+            self.iterate(root, search_board)
+            playouts += 1
+
+        self.playout_count += playouts
+        self.search_time += timeit.default_timer() - start
+        return root
+
+    def iterate(self, root: Node, board_inst: board.Board):
+        """
+        Runs one iteration: selects a path down the tree, expands a node, plays
+        out the rest of the game randomly and backs up the result.
+        :param root:       the root node of the tree
+        :param board_inst: the board instance of the root node, which is played on
+        """
+        # Selection
+        node = root
+        path = [node]
+        while not node.untried and node.children and not node.won:
+            node = node.select_child(self.exploration)
+            board_inst.play(node.move)
+            path.append(node)
+
+        # Expansion
+        if node.untried and not node.won:
+            move = node.untried.pop(self.rng.randrange(len(node.untried)))
+            won = board_inst.is_winning_move(move)
+            board_inst.play(move)
+            child = Node(move, self.get_moves(board_inst), won)
+            node.children[move] = child
+            node = child
+            path.append(node)
+
+        # Simulation, the result is for the player who played the move of the last node
+        if node.won:
+            result = 1
+        else:
+            result = -self.playout(board_inst)
+
+        # Backpropagation, alternating the player at each level
+        for node in reversed(path):
+            node.visits += 1
+            node.value += result
+            result = -result
+
+    def playout(self, board_inst: board.Board) -> int:
+        """
+        Plays random moves until the game ends.
+        :param board_inst: the board instance to play out, which is played on
+        :return:           1 if the current player wins, -1 if it loses, 0 for a draw
+        """
+        moves = self.get_moves(board_inst)
+        self.rng.shuffle(moves)
+        result = 1
+        for move in moves:
+            if board_inst.is_winning_move(move):
+                return result
+            board_inst.play(move)
+            result = -result
+        return 0
+
+    def get_moves(self, board_inst: board.Board) -> list:
+        """
+        Returns the valid moves of a board state.
+        :param board_inst: the board instance
+        :return:           list of valid moves
+        """
+        empty = board_inst.board_mask & ~board_inst.mask
+        moves = []
+        while empty:
+            move = empty & -empty
+            moves.append(move.bit_length() - 1)
+            empty ^= move
+        return moves
+
+    def get_root(self, board_inst: board.Board) -> Node:
+        """
+        Returns the root node for a board state. If the board state follows the
+        previous root by up to 2 moves, the subtree of those moves is reused.
+        :param board_inst: the board instance being searched
+        :return:           the root node
+        """
+        node = None
+        if self.root_state is not None:
+            position, mask, moves = self.root_state
+            played = board_inst.mask ^ mask
+            if (board_inst.mask & mask == mask and 0 <= board_inst.moves - moves <= 2
+                    and played.bit_count() == board_inst.moves - moves):
+                # The first move is by the player to move at the previous root.
+                player = board_inst.position if (board_inst.moves - moves) % 2 == 0 \
+                    else board_inst.position ^ board_inst.mask
+                node = self.root
+                for move_bit in (played & player, played & ~player):
+                    if move_bit and node is not None:
+                        node = node.children.get(move_bit.bit_length() - 1)
+
+        if node is None or node.won:
+            node = Node(moves=self.get_moves(board_inst))
+        self.root = node
+        self.root_state = (board_inst.position, board_inst.mask, board_inst.moves)
+        return node
+
+    def search_parallel(self, board_inst: board.Board) -> dict:
+        """
+        Searches a board state with a tree in each worker process and combines
+        the visits and values of the root moves (root parallelisation).
+        :param board_inst: the board instance being searched
+        :return:           dict of (visits, value) of each root move
+        """
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+
+        options = {'time_limit': self.time_limit, 'playouts': self.playouts,
+                   'exploration': self.exploration}
+        start = timeit.default_timer()
+        futures = [self.pool.submit(_search_task, board_inst.M, board_inst.N, board_inst.k_in_row,
+                                    board_inst.position, board_inst.mask, board_inst.moves,
+                                    options, self.rng.getrandbits(32))
+                   for _ in range(self.workers)]
+
+        stats = {}
+        for future in futures:
+            worker_stats, playouts = future.result()
+            self.playout_count += playouts
+            for move, (visits, value) in worker_stats.items():
+                total_visits, total_value = stats.get(move, (0, 0))
+                stats[move] = (total_visits + visits, total_value + value)
+        self.search_time += timeit.default_timer() - start
+        return stats
+
+    def close(self):
+        """
+        Shuts down the pool of worker processes.
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def new_game(self):
+        """
+        Discards the tree kept between turns.
+        """
+        self.root = None
+        self.root_state = None
+
+    def get_node_count(self) -> int:
+        """
+        Returns the number of playouts, as the counterpart of the nodes of the Solver.
+        :return: the number of playouts
+        """
+        return self.playout_count
+
+    def reset_node_count(self):
+        """
+        Resets the number of playouts and search time to 0.
+        """
+        self.playout_count = 0
+        self.search_time = 0
+
+    def get_playouts_per_sec(self) -> float:
+        """
+        Returns the playouts per second since the count was reset.
+        :return: the playouts per second
+        """
+        return self.playout_count / self.search_time if self.search_time else 0.0
+
+
+"""
+Worker process functions for MCTSSolver.search_parallel.
+"""
+_worker_solvers = {}
+
+
+def _search_task(M: int, N: int, k_in_row: int, position: int, mask: int, moves: int,
+                 options: dict, seed: int) -> tuple:
+    """
+    Searches a board state in a worker process. Each worker keeps a solver per
+    board size so its tree is reused between turns.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :param position: the position of the board state
+    :param mask:     the mask of the board state
+    :param moves:    the moves played of the board state
+    :param options:  the options of the solver
+    :param seed:     the seed of the random playouts
+    :return:         (dict of (visits, value) of each root move, playouts)
+    """
+    if (M, N, k_in_row) not in _worker_solvers:
+        default_board = board.Board(M=M, N=N, k_in_row=k_in_row)
+        _worker_solvers[(M, N, k_in_row)] = MCTSSolver(default_board, **options)
+    solve = _worker_solvers[(M, N, k_in_row)]
+    solve.rng.seed(seed)
+
+    board_inst = board.Board(M=M, N=N, k_in_row=k_in_row, position=position, mask=mask, moves=moves)
+    start_playouts = solve.get_node_count()
+    root = solve.search(board_inst)
+    stats = {move: (child.visits, child.value) for move, child in root.children.items()}
+    return stats, solve.get_node_count() - start_playouts
@@ -0,0 +1,295 @@
+"""
+Alson Lee
+Date: 15/03/24
+
+The pns module contains a depth-first proof-number search (df-pn) which proves
+or disproves that one player can force a win of an m,n,k-game.
+"""
+
+import board
+import solver
+
+import timeit
+
+INF = 1 << 30  # Proof or disproof number of a board state which is decided
+
+
+"""
+Fixed size table which stores the proof and disproof numbers of board states.
+"""
+class ProofNumberTable:
+    """
+    Like the TranspositionTable, the table is a preallocated array of entries
+    indexed by key % size. Each entry stores the full key, the phi and delta
+    numbers of the board state for the player to move and the number of nodes
+    searched to find them. An entry which is decided (phi or delta 0) or which
+    took more nodes is kept over one which took fewer.
+    """
+
+    DEFAULT_SIZE = 1048573  # Prime number close to 2^20
+
+    def __init__(self, size=DEFAULT_SIZE):
+        assert size > 0, 'size must be positive'
+        self.size = size
+        self.keys = [None] * size
+        self.phis = [0] * size
+        self.deltas = [0] * size
+        self.works = [0] * size
+
+    def get(self, key: int):
+        """
+        Gets the numbers stored for a key.
+        :param key: the key of the board state
+        :return:    (phi, delta), None if not stored
+        """
+        i = key % self.size
+        if self.keys[i] == key:
+            return self.phis[i], self.deltas[i]
+        return None
+
+    def put(self, key: int, phi: int, delta: int, work: int):
+        """
+        Stores the numbers for a key, unless the slot holds another board
+        state which is decided or took more work.
+        :param key:   the key of the board state
+        :param phi:   the phi number of the board state
+        :param delta: the delta number of the board state
+        :param work:  the number of nodes searched
+        """
+        i = key % self.size
+        if self.keys[i] is not None and self.keys[i] != key:
+            decided = not self.phis[i] or not self.deltas[i]
+            if (decided or self.works[i] > work) and phi and delta:
+                return
+        self.keys[i] = key
+        self.phis[i] = phi
+        self.deltas[i] = delta
+        self.works[i] = work
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        self.keys = [None] * self.size
+
+
+"""
+ProofNumberSearch class which implements df-pn for an m,n,k-game.
+"""
+class ProofNumberSearch:
+    """
+    The attacker tries to prove a win and the defender to prevent it, so a
+    draw is a disproof. Each board state has a phi and delta number for the
+    player to move: phi is the min number of board states to expand to prove
+    the goal of the player to move and delta to disprove it. A board state
+    with phi 0 is proven for the player to move. Only the most-proving board
+    state, the one with the min delta of the board states after each move, is
+    expanded, within thresholds which depth-first search returns from as soon
+    as a sibling becomes more proving.
+    """
+
+    BUDGET_CHECK_NODES = 256  # Nodes between checks of the time budget of a search
+    EPSILON = 1.25            # Factor of the second min delta in the threshold of the best child (1+epsilon trick)
+
+    def __init__(self, default_board, table_size=ProofNumberTable.DEFAULT_SIZE):
+        self.default_board = default_board
+        self.table = ProofNumberTable(table_size)
+        self.attacker_parity = None  # Parity of the moves of the board states where the attacker moves
+        self.node_count = 0
+        self.deadline = None
+        self.node_limit = None
+
+    def prove(self, board_inst: board.Board, for_current: bool = True,
+              node_budget: int = None, time_budget: float = None):
+        """
+        Proves or disproves that a player can force a win.
+        :param board_inst:  the board instance being searched
+        :param for_current: if the attacker is the current player, otherwise the other player
+        :param node_budget: the max nodes to search, None for no limit
+        :param time_budget: the max seconds to search, None for no limit
+        :return:            True if the attacker can force a win, False if it cannot,
+                            None if the budget ran out first
+        """
+        attacker_parity = (board_inst.moves + (0 if for_current else 1)) % 2
+        if attacker_parity != self.attacker_parity:
+            # Numbers are for the goals of the attacker of the search which stored them.
+            self.table.clear()
+            self.attacker_parity = attacker_parity
+
+        self.deadline = timeit.default_timer() + time_budget if time_budget is not None else None
+        self.node_limit = self.node_count + node_budget if node_budget is not None else None
+
+        search_board = board_inst.copy()
+        try:
+            phi, delta = self.mid(search_board, INF, INF)
+        except solver.SearchStopped:
+            return None
+
+        # phi 0 proves the goal of the player to move at the root.
+        return (phi == 0) == for_current
+
+    def mid(self, board_inst: board.Board, phi_threshold: int, delta_threshold: int) -> tuple:
+        """
+        Searches a board state until its phi or delta number reaches its
+        threshold (multiple iterative deepening).
+        :param board_inst:      the board instance being searched
+        :param phi_threshold:   the phi number to search until
+        :param delta_threshold: the delta number to search until
+        :return:                (phi, delta) of the board instance
+        """
+        self.node_count += 1
+        start_nodes = self.node_count
+        if (self.node_count % self.BUDGET_CHECK_NODES == 0
+                or self.node_limit is not None and self.node_count >= self.node_limit):
+            self.check_budget()
+
+        sym_keys = board_inst.symmetric_keys()
+        key = min(sym_keys)
+        numbers = self.table.get(key)
+        if numbers is None:
+            numbers = self.evaluate(board_inst)
+            if numbers is not None:
+                self.table.put(key, *numbers, 0)
+        if numbers is not None and (numbers[0] >= phi_threshold or numbers[1] >= delta_threshold):
+            return numbers
+
+        # Moves which lead to symmetric board states have the same numbers so only one is searched.
+        # The board state is not decided, so after a move the other player has no win and the
+        # only threats of the player who moved are on the lines through the move.
+        # Symmetries permute the bits, so the key of a board state after a move under a symmetry
+        # is found from the key of the board state under it.
+        geometry = board_inst.geometry
+        position_mask = (1 << geometry.bits) - 1
+        sym_states = [(sym_key & position_mask, sym_key >> geometry.bits) for sym_key in sym_keys]
+        moves = []
+        children = []
+        child_keys = set()
+        for move in self.get_moves(board_inst):
+            bits = board_inst.position | 1 << move
+            threats = 0
+            for line in geometry.win_lines[move]:
+                line_bits = line & bits
+                if line_bits.bit_count() == geometry.k_in_row - 1:
+                    threats |= line ^ line_bits
+            board_inst.play(move)
+            child_key = min((sym_mask | 1 << perm[move]) << geometry.bits | sym_position ^ sym_mask
+                            for perm, (sym_position, sym_mask) in zip(geometry.symmetries, sym_states))
+            if child_key not in child_keys:
+                child_keys.add(child_key)
+                moves.append(move)
+                children.append(self.get_numbers(board_inst, child_key, threats))
+            board_inst.undo(move)
+
+        while True:
+            phi = min(child[1] for child in children)
+            delta = min(INF, sum(child[0] for child in children))
+            if phi >= phi_threshold or delta >= delta_threshold:
+                break
+
+            # The most-proving board state has the min delta, the second min bounds its threshold.
+            best = second_delta = None
+            for i, child in enumerate(children):
+                if best is None or child[1] < children[best][1]:
+                    if best is not None:
+                        second_delta = children[best][1]
+                    best = i
+                elif second_delta is None or child[1] < second_delta:
+                    second_delta = child[1]
+            if second_delta is None:
+                second_delta = INF
+
+            child_phi, child_delta = children[best]
+            board_inst.play(moves[best])
+            children[best] = self.mid(board_inst, delta_threshold + child_phi - delta,
+                                      min(phi_threshold, int(second_delta * self.EPSILON) + 1))
+            board_inst.undo(moves[best])
+
+        self.table.put(key, phi, delta, self.node_count - start_nodes)
+        return phi, delta
+
+    def get_numbers(self, board_inst: board.Board, key: int, threats: int) -> tuple:
+        """
+        Returns the phi and delta numbers of a board state after a move of an
+        undecided board state from the table, or from its immediate status if
+        it is decided, else 1 and 1.
+        :param board_inst: the board instance
+        :param key:        the canonical key of the board instance
+        :param threats:    the winning cells of the other player, on the lines through its move
+        :return:           (phi, delta) of the board instance
+        """
+        numbers = self.table.get(key)
+        if numbers is not None:
+            return numbers
+
+        numbers = self.evaluate(board_inst, 0, threats)
+        if numbers is None:
+            return 1, 1
+        self.table.put(key, *numbers, 0)
+        return numbers
+
+    def evaluate(self, board_inst: board.Board, wins: int = None, threats: int = None):
+        """
+        Returns the phi and delta numbers of a board state which is decided
+        without a search.
+        :param board_inst: the board instance
+        :param wins:       the winning cells of the current player, found if None
+        :param threats:    the winning cells of the other player, found if None
+        :return:           (phi, delta), None if the board state is not decided
+        """
+        empty = board_inst.board_mask & ~board_inst.mask
+        if wins is None:
+            wins = board_inst.winning_cells(board_inst.position)
+        if threats is None:
+            threats = board_inst.winning_cells(board_inst.position ^ board_inst.mask)
+
+        # Whichever player it is, a win on the next move achieves its goal.
+        if wins & empty:
+            return 0, INF
+
+        # Two winning cells of the other player cannot both be blocked.
+        threats &= empty
+        if threats & (threats - 1):
+            return INF, 0
+
+        # A draw is the goal of the defender, which it has reached once every line has
+        # a token of the defender.
+        attacker_to_move = board_inst.moves % 2 == self.attacker_parity
+        defender = board_inst.position ^ board_inst.mask if attacker_to_move else board_inst.position
+        for line in board_inst.all_lines:
+            if not line & defender:
+                return None
+        return (INF, 0) if attacker_to_move else (0, INF)
+
+    def get_moves(self, board_inst: board.Board) -> list:
+        """
+        Returns the moves to search of a board state which is not decided. If
+        the other player can win in 1 cell, blocking it is the only move.
+        :param board_inst: the board instance
+        :return:           list of moves
+        """
+        empty = board_inst.board_mask & ~board_inst.mask
+        threats = board_inst.winning_cells(board_inst.position ^ board_inst.mask) & empty
+        if threats:
+            return [threats.bit_length() - 1]
+        return [move for move in board_inst.geometry.search_order if empty >> move & 1]
+
+    def check_budget(self):
+        """
+        Stops the search if its budget has run out.
+        """
+        if (self.deadline is not None and timeit.default_timer() > self.deadline
+                or self.node_limit is not None and self.node_count >= self.node_limit):
+            raise solver.SearchStopped()
+
+    def get_node_count(self) -> int:
+        """
+        Returns the number of nodes which have been searched.
+        :return: the number of nodes searched
+        """
+        return self.node_count
+
+    def reset_node_count(self):
+        """
+        Resets the number of nodes which have been searched to 0.
+        """
+        self.node_count = 0
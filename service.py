@@ -0,0 +1,335 @@
+"""
+Alson Lee
+Date: 15/03/24
+
+The service module contains a long-running analysis service which solves board
+states sent over a local socket, with a warm solver for each board size.
+
+Usage: python service.py [host:port | unix socket path]
+"""
+
+import board
+import solver
+import stats
+
+import asyncio
+import collections
+import concurrent.futures
+import json
+import sys
+import timeit
+
+"""
+SERVICE SETTINGS
+"""
+HOST = '127.0.0.1'        # Default host of the TCP socket
+PORT = 8765               # Default port of the TCP socket
+SOLVER_OPTIONS = {}       # Options of the solver of each board size, e.g. {'time_limit': 0.9}
+MAX_CELLS = 25            # Max cells of a board to solve, boards larger need a depth or time limit
+MAX_SIZES = 4             # Max board sizes with a warm worker process, the least recently used is shut down
+MAX_PROVEN = 1000000      # Max proven scores kept by a solver before they are cleared
+LATENCY_WINDOW = 1000     # Number of recent requests of the latency percentiles
+PERCENTILES = (50, 90, 99)
+
+"""
+Protocol.
+
+Each request and response is a JSON object on one line. Requests are answered
+as they finish, not in order, so a request may have an "id" which its response
+echoes.
+
+Solve     {"id": 1, "M": 4, "N": 4, "k": 4, "cells": [5, 10]}
+          -> {"id": 1, "scores": [[...], ...], "nodes": 1234, "time": 0.01}
+          Cells are numbered from 0 and played in order from the empty board.
+Metrics   {"id": 2, "metrics": true}
+          -> {"id": 2, "metrics": {...}}
+Errors    -> {"id": 1, "error": "..."}
+"""
+
+
+"""
+Class to hold the counters and latencies of the service.
+"""
+class ServiceMetrics:
+    """
+    Latencies are kept for the most recent requests only, so the percentiles
+    follow the current load. The queue depth of a board size is the number of
+    solves submitted to its worker which have not finished.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.requests = 0         # Solve requests received
+        self.errors = 0           # Requests answered with an error
+        self.deduplicated = 0     # Solve requests answered by a solve already in flight
+        self.solves = 0           # Solves run by the workers
+        self.nodes = 0            # Nodes searched by the workers
+        self.latencies = collections.deque(maxlen=window)
+        self.queue_depths = {}    # Unfinished solves of each board size
+
+    def add_latency(self, seconds: float):
+        """
+        Records the time to answer a solve request.
+        :param seconds: the time from receiving the request to answering it
+        """
+        self.latencies.append(seconds)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the metrics as a dict which can be exported as JSON.
+        :return: dict of the metrics
+        """
+        latencies = list(self.latencies)
+        return {'requests': self.requests,
+                'errors': self.errors,
+                'deduplicated': self.deduplicated,
+                'solves': self.solves,
+                'nodes': self.nodes,
+                'in_flight': sum(self.queue_depths.values()),
+                'queue_depths': {f'{M}x{N}x{k_in_row}': depth
+                                 for (M, N, k_in_row), depth in self.queue_depths.items()},
+                'latency': {f'p{p}': stats.percentile(latencies, p) for p in PERCENTILES}}
+
+
+"""
+AnalysisService class which answers solve requests with a worker per board size.
+"""
+class AnalysisService:
+    """
+    Each board size has a single worker process which keeps its solver, and so
+    its transposition table and proven scores, between requests. Solves of the
+    same board size run one at a time in its worker and different board sizes
+    run in parallel. The event loop only parses requests and awaits the
+    workers, so it never blocks on a solve. A request for a board state which
+    is already being solved awaits the same solve.
+    """
+
+    def __init__(self, solver_options=None, max_sizes=MAX_SIZES):
+        self.solver_options = dict(SOLVER_OPTIONS if solver_options is None else solver_options)
+        self.max_sizes = max_sizes
+        self.workers = collections.OrderedDict()  # Worker pool of each board size, least recently used first
+        self.in_flight = {}                       # Futures of the solves in flight by board state
+        self.metrics = ServiceMetrics()
+
+    async def handle_request(self, request: dict) -> dict:
+        """
+        Answers a request.
+        :param request: the request
+        :return:        the response
+        """
+        response = {'id': request['id']} if 'id' in request else {}
+        if request.get('metrics'):
+            response['metrics'] = self.metrics.to_dict()
+            return response
+
+        start = timeit.default_timer()
+        self.metrics.requests += 1
+        try:
+            M, N, k_in_row, position, mask, moves = self.parse_solve(request)
+            scores, nodes, solve_time = await self.solve(M, N, k_in_row, position, mask, moves)
+        except ValueError as e:
+            self.metrics.errors += 1
+            response['error'] = str(e)
+            return response
+        except Exception as e:
+            # The worker failed, e.g. it was shut down or ran out of memory.
+            self.metrics.errors += 1
+            response['error'] = f'solve failed: {e!r}'
+            return response
+
+        response.update({'scores': scores, 'nodes': nodes, 'time': solve_time})
+        self.metrics.add_latency(timeit.default_timer() - start)
+        return response
+
+    def parse_solve(self, request: dict) -> tuple:
+        """
+        Finds the board state of a solve request.
+        :param request: the request
+        :return:        (M, N, k_in_row, position, mask, moves) of the board state
+        """
+        try:
+            M, N, k_in_row = int(request['M']), int(request['N']), int(request['k'])
+            cells = [int(cell) for cell in request.get('cells', [])]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('a solve request needs integers M, N, k and a list of cells')
+        if not (2 < M and 2 < N and k_in_row <= M and k_in_row <= N):
+            raise ValueError(f'{M}x{N}x{k_in_row} is not a valid board size')
+        if M * N > MAX_CELLS and not (self.solver_options.get('depth_limit')
+                                      or self.solver_options.get('time_limit')):
+            raise ValueError(f'{M}x{N} boards are too large to solve, max {MAX_CELLS} cells')
+
+        board_inst = board.Board(M=M, N=N, k_in_row=k_in_row)
+        for cell in cells:
+            move = board_inst.cell_to_move(cell) if 0 <= cell < board_inst.cells else None
+            if move is None or not board_inst.is_valid_move(move):
+                raise ValueError(f'cell {cell} is not an empty cell')
+            if board_inst.is_winning_move(move):
+                raise ValueError(f'cell {cell} wins the game')
+            board_inst.play(move)
+        if board_inst.get_num_moves() == board_inst.cells:
+            raise ValueError('the board is full')
+        return M, N, k_in_row, board_inst.position, board_inst.mask, board_inst.moves
+
+    async def solve(self, M: int, N: int, k_in_row: int, position: int, mask: int, moves: int) -> tuple:
+        """
+        Solves a board state in the worker of its board size, or awaits the
+        solve of the same board state if it is already in flight.
+        :param M:        the board width
+        :param N:        the board height
+        :param k_in_row: the tokens in a row to win
+        :param position: the position of the board state
+        :param mask:     the mask of the board state
+        :param moves:    the moves played of the board state
+        :return:         (score matrix, nodes, solve time)
+        """
+        key = (M, N, k_in_row, position, mask)
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.metrics.deduplicated += 1
+            return await asyncio.shield(future)
+
+        size = (M, N, k_in_row)
+        future = asyncio.get_running_loop().run_in_executor(
+            self.get_worker(size), _solve_task, M, N, k_in_row, position, mask, moves, self.solver_options)
+        self.in_flight[key] = future
+        self.metrics.queue_depths[size] = self.metrics.queue_depths.get(size, 0) + 1
+
+        def solve_done(future: asyncio.Future):
+            # The solve keeps running in the worker if the requests awaiting it are
+            # cancelled, so it is only finished once the worker has answered.
+            del self.in_flight[key]
+            self.metrics.queue_depths[size] -= 1
+            if not future.cancelled() and future.exception() is None:
+                self.metrics.solves += 1
+                self.metrics.nodes += future.result()[1]
+
+        future.add_done_callback(solve_done)
+        return await asyncio.shield(future)
+
+    def get_worker(self, size: tuple) -> concurrent.futures.ProcessPoolExecutor:
+        """
+        Returns the worker of a board size, starting it if there is none. The
+        least recently used worker is shut down if there are too many.
+        :param size: (M, N, k_in_row) of the board size
+        :return:     the worker pool of one process
+        """
+        if size in self.workers:
+            self.workers.move_to_end(size)
+            return self.workers[size]
+
+        while len(self.workers) >= self.max_sizes:
+            _, worker = self.workers.popitem(last=False)
+            worker.shutdown(wait=False)  # Solves already submitted still finish
+        self.workers[size] = concurrent.futures.ProcessPoolExecutor(1)
+        return self.workers[size]
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Answers the requests of a connection. Each request is answered in its
+        own task, so a slow solve does not hold up the requests after it.
+        :param reader: the stream of requests
+        :param writer: the stream of responses
+        """
+        tasks = set()
+
+        async def answer(line: bytes):
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError
+            except ValueError:
+                self.metrics.errors += 1
+                response = {'error': 'a request must be a JSON object'}
+            else:
+                response = await self.handle_request(request)
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(answer(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: str = None):
+        """
+        Serves requests until cancelled.
+        :param address: 'host:port' of a TCP socket or the path of a Unix socket, None for HOST:PORT
+        """
+        if address is not None and ':' not in address:
+            server = await asyncio.start_unix_server(self.handle_client, path=address)
+        else:
+            host, _, port = (address or f'{HOST}:{PORT}').rpartition(':')
+            server = await asyncio.start_server(self.handle_client, host, int(port))
+
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        """
+        Shuts down the worker processes.
+        """
+        for worker in self.workers.values():
+            worker.shutdown()
+        self.workers.clear()
+
+
+"""
+Worker process functions for AnalysisService.solve.
+"""
+_worker_solver = None
+
+
+def _solve_task(M: int, N: int, k_in_row: int, position: int, mask: int, moves: int,
+                options: dict) -> tuple:
+    """
+    Solves a board state in a worker process. A worker only solves one board
+    size, so it keeps a single solver between tasks.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :param position: the position of the board state
+    :param mask:     the mask of the board state
+    :param moves:    the moves played of the board state
+    :param options:  the options of the solver
+    :return:         (score matrix, nodes, solve time)
+    """
+    global _worker_solver
+    if _worker_solver is None:
+        _worker_solver = solver.Solver(board.Board(M=M, N=N, k_in_row=k_in_row), **options)
+    solve = _worker_solver
+    if len(solve.proven) > MAX_PROVEN:
+        solve.proven.clear()
+
+    board_inst = board.Board(M=M, N=N, k_in_row=k_in_row, position=position, mask=mask, moves=moves)
+    solve.reset_node_count()
+    start = timeit.default_timer()
+    scores = solve.solve_score_each(board_inst)
+    solve_time = timeit.default_timer() - start
+    return scores, solve.get_node_count(), solve_time
+
+
+def main():
+    if len(sys.argv) > 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    address = sys.argv[1] if len(sys.argv) == 2 else None
+    service = AnalysisService()
+    print(f'Serving on {address or f"{HOST}:{PORT}"}')
+    try:
+        asyncio.run(service.serve(address))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,21 +5,67 @@ Date: 15/03/24
 The solver module contains the solving algorithms for an m,n,k-game.
 """
 
-import numpy as np
-# import multiprocessing as mp
-# print(f'CPU cores available: {mp.cpu_count()}')
-
 import board
-import copy
+import transposition
+
+import collections
+import math
+import threading
+import timeit
+
+class SearchStopped(Exception):
+    """
+    Raised inside a search when its time or node budget has run out or it has
+    been cancelled.
+    """
+
 
 """
 Solver class which implements a recursive solving algorithm for an m,n,k-game.
 """
 class Solver:
 
-    def __init__(self, default_board):
+    SEARCH_MODES = ('null_window', 'full_window')
+    ORDERING_HEURISTICS = ('threats', 'killers', 'history')
+    BUDGET_CHECK_NODES = 256  # Nodes between checks of the time and cancel budget of a search
+
+    def __init__(self, default_board, tt_size=transposition.TranspositionTable.DEFAULT_SIZE,
+                 tt_replacement='depth', search='null_window', ordering=('threats',),
+                 workers=1, split_depth=1, book=None, tablebase=None, stats=False,
+                 depth_limit=None, time_limit=None):
+        assert search in self.SEARCH_MODES, 'unknown search mode'
+        assert all(h in self.ORDERING_HEURISTICS for h in ordering), 'unknown ordering heuristic'
+        assert workers > 0, 'workers must be positive'
+        assert split_depth in (1, 2), 'split_depth must be 1 or 2'
+        assert depth_limit is None or depth_limit > 0, 'depth_limit must be positive'
+        assert time_limit is None or time_limit > 0, 'time_limit must be positive'
+
+        # Options to create the solvers of the worker processes
+        self.options = {'tt_size': tt_size, 'tt_replacement': tt_replacement,
+                        'search': search, 'ordering': ordering}
+        self.workers = workers          # Number of processes to solve root moves
+        self.split_depth = split_depth  # Depth to split the tree into tasks
+        self.pool = None
+
+        self.depth_limit = depth_limit  # Max depth of a limited search, None for no limit
+        self.time_limit = time_limit    # Seconds per solve_score_each of a limited search
+        self.deadline = None            # Time at which a search stops, None for no limit
+        self.node_limit = None          # Node count at which a search stops, None for no limit
+        self.budgeted = False           # If the search checks the budget
+        self.cancelled = threading.Event()  # Set to stop a budgeted search from another thread
+        self.searched_depth = None      # Depth of the last completed limited search
+        self.horizon_reached = False    # If the last limited search evaluated any node or timed out
+
+        self.book = book            # Opening book of solved board states
+        self.tablebase = tablebase  # Endgame tablebase of every board state
+        self.proven = {}  # Exact scores of board states solved in the current game
+
         self.node_count = 0
+        self.stats = None  # Search statistics, only recorded when enabled
+        if stats:
+            self.enable_stats()
         self.default_board = default_board
+        self.search = search
 
         self.score_each = None
         if self.score_each is None:
@@ -30,7 +76,11 @@ class Solver:
         if not self.search_order:
             self.search_order = self.generate_search_order()
 
-        self.mem_table = {}
+        self.mem_table = transposition.TranspositionTable(tt_size, tt_replacement)
+
+        self.ordering = tuple(ordering)
+        self.killers = [[] for _ in range(self.default_board.cells)]
+        self.history = [0] * self.default_board.bits
 
     def negamax(self, board_inst: board.Board, alpha: int, beta: int) -> int:        
         """
@@ -54,61 +104,297 @@ class Solver:
         # print(f'key{board_inst.key():>6}  a{alpha:>3}  b{beta:>3}')
 
         # Increment counter of nodes explored.
-        # self.node_count += 1
-        # if self.node_count % 10000 == 0: print(f'Nodes searched: {self.node_count}')
+        self.node_count += 1
+        if self.budgeted and (self.node_count % self.BUDGET_CHECK_NODES == 0
+                              or self.node_limit is not None and self.node_count >= self.node_limit):
+            self.check_budget()
+        stats = self.stats
+        if stats is not None:
+            stats.add_node(board_inst.moves)
 
         # First, check if there are no moves available i.e. draw.
-        if board_inst.get_num_moves() == board_inst.M * board_inst.N:
+        geometry = board_inst.geometry
+        empty_cells = geometry.cells - board_inst.moves
+        if empty_cells == 0:
             return 0
 
         # Second, check if the current player can win the next move
-        for i in range(board_inst.M * board_inst.N):
-            move = np.uint(self.search_order[i])
-            if (board_inst.is_valid_move(move)
-                    and board_inst.is_winning_move(move)):
-                # If the current player can win, return the score proportional to the moves it takes
-                score = (board_inst.M * board_inst.N - board_inst.get_num_moves() + 1) // 2
-                return score
+        empty = geometry.board_mask & ~board_inst.mask
+        if stats is not None:
+            stats.win_checks += 1
+        if board_inst.winning_cells(board_inst.position) & empty:
+            # If the current player can win, return the score proportional to the moves it takes
+            score = (empty_cells + 1) // 2
+            return score
+
+        # Third, check if the other player can win the next move
+        if stats is not None:
+            stats.win_checks += 1
+        forced_moves = board_inst.winning_cells(board_inst.position ^ board_inst.mask) & empty
+        if forced_moves & (forced_moves - 1):
+            # If the other player can win in 2 or more cells, only one can be blocked so it is a loss
+            score = -(empty_cells // 2)
+            return score
 
         # The upper bound of beta should not exceed the score limited by the board.
-        upper_bound = (board_inst.M * board_inst.N - board_inst.get_num_moves() - 1) // 2
-        
-        # Check if there is a memo for the current solve.
-        # memo = self.mem_table.get(board_inst.key())
-        # if memo:
-            # print(f'   HIT {board_inst.key()}')
-            # upper_bound = memo
+        upper_bound = (empty_cells - 1) // 2
 
         if beta > upper_bound:
             beta = upper_bound
             # If alpha has converged to beta, return score.
             if alpha >= beta:
                 return beta
-            
-        # TODO: Do not solve symmetric rotations and reflections of the same game.
+
+        # Check if there is a memo of the bounds for the current board state.
+        # Symmetric board states have the same score so share the canonical key.
+        sym_keys = board_inst.symmetric_keys()
+        key = min(sym_keys)
+        memo = self.mem_table.get(key)
+        if stats is not None:
+            stats.add_tt_probe(memo is not None)
+        if memo is not None:
+            lower, upper = memo
+            if alpha < lower:
+                alpha = lower
+            if beta > upper:
+                beta = upper
+            # If the memo has narrowed the window closed, return score.
+            if alpha >= beta:
+                return alpha
+
+        alpha_start = alpha
+
+        # A symmetry which maps the board state onto itself maps each move onto a
+        # move with the same score, so only the first move of each is searched.
+        self_symmetries = [perm for perm, sym_key 
+                           in zip(geometry.symmetries[1:], sym_keys[1:])
+                           if sym_key == sym_keys[0]]
+        symmetric_moves = set()
+
+        # If the other player can win in 1 cell, the move to block it is the only one to search
+        if forced_moves:
+            moves = [forced_moves.bit_length() - 1]
+        else:
+            moves = self.order_moves(board_inst)
 
         # Last, check all possible next moves and return the best one
-        for i in range(board_inst.M * board_inst.N):
-            move = np.uint(self.search_order[i])
-            # If valid, try this move
-            if board_inst.is_valid_move(move):  
-                check_next_move = copy.deepcopy(board_inst)
-                check_next_move.play(move)  # Try the valid move on a copy of the board
+        for index, move in enumerate(moves):
+            # If not symmetric to a searched move, try this move
+            if move not in symmetric_moves:
+                for perm in self_symmetries:
+                    symmetric_moves.add(perm[move])
+
+                board_inst.play(move)  # Try the valid move and undo it after solving
 
                 # Recursively solve through the move whilst switching +ve, -ve each time.
-                score = -self.negamax(check_next_move, -beta, -alpha)
+                score = -self.negamax(board_inst, -beta, -alpha)
+                board_inst.undo(move)
                 
                 # Return score if a better move is found
                 if score >= beta:
+                    # The score is a lower bound as the remaining moves were pruned.
+                    self.store_memo(board_inst, key, score, upper_bound)
+                    self.store_cutoff(board_inst, move)
+                    if stats is not None:
+                        stats.add_cutoff(index)
                     return score
                 
                 if score > alpha:
                     alpha = score
 
-        # self.mem_table[board_inst.key()] = alpha
+        if alpha > alpha_start:
+            # A move within the window was found so the score is exact.
+            self.store_memo(board_inst, key, alpha, alpha)
+        else:
+            # No move improved alpha so the score is an upper bound.
+            self.store_memo(board_inst, key, -geometry.cells, alpha)
+
+        return alpha
+
+    def negamax_limited(self, board_inst: board.Board, alpha: float, beta: float, depth: int) -> float:
+        """
+        Searches a move with the negamax algorithm with alpha-beta pruning up to 
+        depth moves ahead, where board states are scored by the evaluation 
+        function. Scores of wins and losses found within the depth are exact 
+        and always outweigh an evaluation, which lies in (-1, 1). Evaluations 
+        are not proven, so only the bounds of board states searched without 
+        evaluating any node are stored in the transposition table.
+        :param board_inst: the board instance being searched
+        :param alpha:      the min score for the maximising player (current player)
+        :param beta:       the max score for the minimising player (other player)
+        :param depth:      the number of moves to search ahead
+        :return:           the score for the board instance
+        """
+        self.node_count += 1
+        if self.budgeted and (self.node_count % self.BUDGET_CHECK_NODES == 0
+                              or self.node_limit is not None and self.node_count >= self.node_limit):
+            self.check_budget()
+        stats = self.stats
+        if stats is not None:
+            stats.add_node(board_inst.moves)
+
+        if board_inst.get_num_moves() == board_inst.cells:
+            return 0
+
+        empty = board_inst.board_mask & ~board_inst.mask
+        if stats is not None:
+            stats.win_checks += 1
+        if board_inst.winning_cells(board_inst.position) & empty:
+            return (board_inst.cells - board_inst.get_num_moves() + 1) // 2
+
+        if stats is not None:
+            stats.win_checks += 1
+        forced_moves = board_inst.winning_cells(board_inst.position ^ board_inst.mask) & empty
+        if forced_moves & (forced_moves - 1):
+            return -((board_inst.cells - board_inst.get_num_moves()) // 2)
+
+        # Bounds proven by exact searches still apply.
+        key = board_inst.canonical_key()
+        memo = self.mem_table.get(key)
+        if stats is not None:
+            stats.add_tt_probe(memo is not None)
+        if memo is not None:
+            lower, upper = memo
+            if lower == upper or lower >= beta:
+                return lower
+            if upper <= alpha:
+                return upper
 
+        if depth == 0:
+            self.horizon_reached = True
+            return self.evaluate(board_inst)
+
+        # Track whether this subtree evaluates any node, separately from its siblings.
+        horizon_reached = self.horizon_reached
+        self.horizon_reached = False
+        alpha_start = alpha
+
+        if forced_moves:
+            moves = [forced_moves.bit_length() - 1]
+        else:
+            moves = self.order_moves(board_inst)
+
+        upper_bound = (board_inst.cells - board_inst.get_num_moves() - 1) // 2
+        for index, move in enumerate(moves):
+            board_inst.play(move)
+            score = -self.negamax_limited(board_inst, -beta, -alpha, depth - 1)
+            board_inst.undo(move)
+
+            if score >= beta:
+                self.store_cutoff(board_inst, move)
+                if stats is not None:
+                    stats.add_cutoff(index)
+                if not self.horizon_reached:
+                    # The score may be a window bound from an evaluation of a sibling, which
+                    # the true score is at least, so its ceiling is a proven lower bound.
+                    self.store_memo(board_inst, key, math.ceil(score), upper_bound)
+                self.horizon_reached |= horizon_reached
+                return score
+            if score > alpha:
+                alpha = score
+
+        if not self.horizon_reached:
+            # The scores are proven, but alpha may be a window bound rather than a score.
+            if alpha > alpha_start:
+                self.store_memo(board_inst, key, alpha, alpha)
+            else:
+                self.store_memo(board_inst, key, -board_inst.cells, math.floor(alpha))
+        self.horizon_reached |= horizon_reached
         return alpha
 
+    def evaluate(self, board_inst: board.Board) -> float:
+        """
+        Estimates the score of a board state for the current player from the 
+        open lines of each player, i.e. lines with tokens of only one player. 
+        A line with more tokens weighs 4 times more per token. The evaluation 
+        is (current - other) / (current + other + 1), which lies in (-1, 1).
+        :param board_inst: the board instance being evaluated
+        :return:           the evaluation of the board instance
+        """
+        position = board_inst.position
+        opponent = position ^ board_inst.mask
+        current = other = 0
+        for line in board_inst.all_lines:
+            own = line & position
+            theirs = line & opponent
+            if own and not theirs:
+                current += 4 ** own.bit_count()
+            elif theirs and not own:
+                other += 4 ** theirs.bit_count()
+        return (current - other) / (current + other + 1)
+
+    def order_moves(self, board_inst: board.Board) -> list:
+        """
+        Orders the valid moves so that the moves most likely to cause a beta 
+        cutoff are searched first. With all ordering heuristics, moves are 
+        ordered by:
+        1. Blocking an immediate win of the other player.
+        2. Number of open (k-1)-lines created i.e. lines with k-1 tokens of 
+           the current player and none of the other player.
+        3. Killer moves which caused a cutoff at the same depth.
+        4. History of cutoffs caused by the move, weighted by the depth.
+        5. The search order spiralling out from the centre.
+        :param board_inst: the board instance being solved
+        :return:           the valid moves in order
+        """
+        moves = [move for move in self.search_order if board_inst.is_valid_move(move)]
+        if not self.ordering:
+            return moves
+
+        use_threats = 'threats' in self.ordering
+        killers = self.killers[board_inst.moves] if 'killers' in self.ordering else ()
+        history = self.history if 'history' in self.ordering else None
+
+        if use_threats:
+            position = board_inst.position
+            opponent = position ^ board_inst.mask
+            blocks = board_inst.winning_cells(opponent)
+            if self.stats is not None:
+                self.stats.win_checks += 1
+            lines = board_inst.geometry.win_lines
+            k_in_row = board_inst.geometry.k_in_row
+
+        priorities = []
+        for rank, move in enumerate(moves):
+            block = threats = 0
+            if use_threats:
+                block = blocks >> move & 1
+                next_pos = position | 1 << move
+                for line in lines[move]:
+                    if not line & opponent and (line & next_pos).bit_count() == k_in_row - 1:
+                        threats += 1
+            priorities.append((block, threats, move in killers,
+                               history[move] if history is not None else 0, -rank))
+
+        return [move for _, move in sorted(zip(priorities, moves), reverse=True)]
+
+    def store_cutoff(self, board_inst: board.Board, move: int):
+        """
+        Records a move which caused a beta cutoff as a killer move at its depth
+        and in the history table.
+        :param board_inst: the board instance where the cutoff happened
+        :param move:       the move which caused the cutoff
+        """
+        killers = self.killers[board_inst.moves]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+
+        empty_cells = board_inst.geometry.cells - board_inst.moves
+        self.history[move] += empty_cells * empty_cells
+
+    def store_memo(self, board_inst: board.Board, key: int, lower: int, upper: int):
+        """
+        Stores the bounds of the score of a board state in the transposition table.
+        :param board_inst: the board instance which was solved
+        :param key:        the key of the board instance
+        :param lower:      the lower bound of the score
+        :param upper:      the upper bound of the score
+        """
+        # Only proven scores are stored, never evaluations of a depth-limited search.
+        assert type(lower) is int and type(upper) is int, 'bounds must be integer scores'
+        self.mem_table.put(key, lower, upper, board_inst.geometry.cells - board_inst.moves)
+
     def solve_score_each(self, board_inst: board.Board):
         """
         Solves all valid moves and returns the score of each of the valid 
@@ -116,30 +402,441 @@ class Solver:
         :param board_inst:     the board instance being solved
         :return:               score matrix of each valid move
         """
-        for i in range(board_inst.M * board_inst.N):
-            move = np.uint(self.search_order[i])
+        if self.depth_limit is not None or self.time_limit is not None:
+            return self.solve_score_each_limited(board_inst)
+        if self.workers > 1:
+            return self.solve_score_each_parallel(board_inst)
+
+        # Moves which lead to symmetric board states have the same score.
+        solved = {}
+
+        for i in range(board_inst.cells):
+            move = self.search_order[i]
             if board_inst.is_valid_move(move):
-                check_move = copy.deepcopy(board_inst)
-                if check_move.is_winning_move(move):
-                    score = (board_inst.M * board_inst.N - board_inst.get_num_moves() + 1) // 2
+                if self.stats is not None:
+                    self.stats.win_checks += 1
+                if board_inst.is_winning_move(move):
+                    score = (board_inst.cells - board_inst.get_num_moves() + 1) // 2
                     self.set_score_each(move, score)
                 else:
-                    check_move.play(move)
-                    self.set_score_each(move, -self.solve(check_move))
+                    board_inst.play(move)
+                    key = board_inst.canonical_key()
+                    if key not in solved:
+                        start = timeit.default_timer()
+                        solved[key] = -self.solve(board_inst)
+                        if self.stats is not None:
+                            self.stats.add_root_move_time(board_inst.move_to_cell(move),
+                                                          timeit.default_timer() - start)
+                    board_inst.undo(move)
+                    self.set_score_each(move, solved[key])
             else:
                 self.set_score_each(move, None)
 
         return self.score_each                 
 
-    def solve(self, board_inst: board.Board) -> int:
+    def solve_score_each_parallel(self, board_inst: board.Board):
+        """
+        Solves all valid moves with a pool of worker processes and returns the 
+        score of each of the valid moves in matrix form. The scores are the same
+        as solving each move one after another.
+
+        With split_depth 1 each root move is a task. With split_depth 2 each 
+        reply to a root move is a task, and a reply is only solved exactly if 
+        it can beat the best reply to the same root move solved so far.
+        :param board_inst:     the board instance being solved
+        :return:               score matrix of each valid move
+        """
+        # Imported here as only a parallel solve needs it and it is slow to import.
+        import concurrent.futures
+
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(self.options,))
+
+        # Root moves which lead to symmetric board states share a group.
+        # The best score of a group is the score for the player after the root move.
+        groups = {}
+        root_moves = []
+        tasks = collections.deque()
+
+        for move in self.search_order:
+            if not board_inst.is_valid_move(move):
+                self.set_score_each(move, None)
+            elif board_inst.is_winning_move(move):
+                score = (board_inst.cells - board_inst.get_num_moves() + 1) // 2
+                self.set_score_each(move, score)
+            else:
+                board_inst.play(move)
+                key = board_inst.canonical_key()
+                if key not in groups:
+                    groups[key] = {'best': None}
+                    self.split_tasks(board_inst, groups[key], tasks)
+                board_inst.undo(move)
+                root_moves.append((move, key))
+
+        # Submit tasks as workers free up, so later replies are solved against 
+        # the best reply found so far.
+        pending = {}
+        while tasks or pending:
+            while tasks and len(pending) < self.workers:
+                group, position, mask, moves, is_reply = tasks.popleft()
+                max_score = None
+                if is_reply and group['best'] is not None:
+                    max_score = -group['best']
+                future = self.pool.submit(_solve_task, board_inst.M, board_inst.N, board_inst.k_in_row,
+                                          position, mask, moves, None, max_score, self.stats is not None)
+                pending[future] = (group, is_reply)
+
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                group, is_reply = pending.pop(future)
+                score, nodes, task_stats = future.result()
+                self.node_count += nodes
+                if self.stats is not None and task_stats is not None:
+                    self.stats.merge(task_stats)
+                if is_reply:
+                    score = -score
+                if group['best'] is None or score > group['best']:
+                    group['best'] = score
+
+        for key, group in groups.items():
+            self.proven[key] = group['best']
+        for move, key in root_moves:
+            self.set_score_each(move, -groups[key]['best'])
+
+        return self.score_each
+
+    def solve_score_each_limited(self, board_inst: board.Board):
+        """
+        Searches all valid moves with iterative deepening of depth-limited 
+        searches and returns the score of each of the valid moves in matrix 
+        form. Each iteration searches one move deeper until the depth limit, 
+        the time limit or the end of the game. If the time limit passes during 
+        an iteration, the scores of the last completed iteration are kept, so 
+        scores are ready by the time limit. Scores between -1 and 1 are 
+        evaluations rather than proven scores.
+        :param board_inst:     the board instance being searched
+        :return:               score matrix of each valid move
+        """
+        self.searched_depth = None
+        empty_cells = board_inst.cells - board_inst.get_num_moves()
+        max_depth = empty_cells if self.depth_limit is None else min(self.depth_limit, empty_cells)
+        start = timeit.default_timer()
+
+        try:
+            for depth in range(1, max_depth + 1):
+                # The first iteration always completes so there are scores to return.
+                if depth > 1:
+                    self.set_budget(start + self.time_limit if self.time_limit is not None else None)
+                self.horizon_reached = False
+
+                scores = {}
+                searched = {}  # Moves which lead to symmetric board states have the same score.
+                try:
+                    for move in self.search_order:
+                        if not board_inst.is_valid_move(move):
+                            scores[move] = None
+                        elif board_inst.is_winning_move(move):
+                            scores[move] = (board_inst.cells - board_inst.get_num_moves() + 1) // 2
+                        else:
+                            # Search a copy, as a timeout leaves the moves of the search played.
+                            search_board = board_inst.copy()
+                            search_board.play(move)
+                            key = search_board.canonical_key()
+                            if key not in searched:
+                                searched[key] = -self.negamax_limited(search_board, -board_inst.cells,
+                                                                      board_inst.cells, depth - 1)
+                            scores[move] = searched[key]
+                except SearchStopped:
+                    # The scores of the last completed iteration are not proven either.
+                    self.horizon_reached = True
+                    break
+                finally:
+                    self.clear_budget()
+
+                for move, score in scores.items():
+                    self.set_score_each(move, score)
+                self.searched_depth = depth
+
+                # Without reaching the horizon every score is exact, so deeper iterations are the same.
+                if not self.horizon_reached:
+                    break
+        finally:
+            # Cleared after the search, so a cancel sent before it checks the budget is not lost.
+            self.cancelled.clear()
+
+        return self.score_each
+
+    def solve_bounds_each(self, board_inst: board.Board, time_budget: float = None,
+                          node_budget: int = None):
+        """
+        Solves all valid moves within a budget and returns the bounds of the 
+        score of each of the valid moves in matrix form. A move with equal 
+        bounds is solved. Each step narrows the bounds of the unsolved move with
+        the highest max score by one null window search, so the best move is 
+        solved first and the bounds of every move only narrow. The search stops
+        when the time or node budget has run out or cancel() is called, and the
+        bounds proven so far are returned.
+        :param board_inst:  the board instance being solved
+        :param time_budget: the max seconds to search, None for no limit
+        :param node_budget: the max nodes to search, None for no limit
+        :return:            bounds matrix of (min score, max score) of each valid move
+        """
+        bounds_each = [[None for _ in range(board_inst.M)] for _ in range(board_inst.N)]
+        cells = board_inst.cells
+
+        # Bounds of the board states after each move, for the other player.
+        # Moves which lead to symmetric board states share the same bounds.
+        states = {}
+        root_moves = []
+        for move in self.search_order:
+            if not board_inst.is_valid_move(move):
+                continue
+            if board_inst.is_winning_move(move):
+                score = (cells - board_inst.get_num_moves() + 1) // 2
+                root_moves.append((move, (score, score)))
+                continue
+            search_board = board_inst.copy()
+            search_board.play(move)
+            key = search_board.canonical_key()
+            if key not in states:
+                score = self.get_solved(search_board, key)
+                bounds = (score, score) if score is not None else self.get_bounds(search_board)
+                states[key] = {'board': search_board, 'bounds': bounds}
+            root_moves.append((move, states[key]))
+
+        start = timeit.default_timer()
+        self.set_budget(start + time_budget if time_budget is not None else None,
+                        self.node_count + node_budget if node_budget is not None else None)
+        try:
+            while True:
+                # The best move for the current player has the lowest min score for the other player.
+                unsolved = [state for state in states.values() if state['bounds'][0] < state['bounds'][1]]
+                if not unsolved:
+                    break
+                state = min(unsolved, key=lambda state: state['bounds'][0])
+                state['bounds'] = self.narrow_bounds(state['board'], *state['bounds'])
+                if state['bounds'][0] == state['bounds'][1]:
+                    self.proven[state['board'].canonical_key()] = state['bounds'][0]
+        except SearchStopped:
+            # The interrupted search left moves played on its copy of the board.
+            pass
+        finally:
+            self.clear_budget()
+            # Cleared after the search, so a cancel sent before it checks the budget is not lost.
+            self.cancelled.clear()
+
+        for move, state in root_moves:
+            if isinstance(state, dict):
+                min_score, max_score = state['bounds']
+                state = (-max_score, -min_score)
+            bounds_each[move // board_inst.stride][move % board_inst.stride] = state
+
+        return bounds_each
+
+    def set_budget(self, deadline: float = None, node_limit: int = None):
+        """
+        Sets the budget of the following searches, which stop with SearchStopped 
+        once it runs out or cancel() is called.
+        :param deadline:   the time at which to stop, None for no limit
+        :param node_limit: the node count at which to stop, None for no limit
+        """
+        self.deadline = deadline
+        self.node_limit = node_limit
+        self.budgeted = True
+
+    def clear_budget(self):
+        """
+        Removes the budget so the following searches run until they finish.
+        """
+        self.deadline = None
+        self.node_limit = None
+        self.budgeted = False
+
+    def check_budget(self):
+        """
+        Stops the search if its budget has run out or it has been cancelled.
+        """
+        if (self.cancelled.is_set()
+                or self.deadline is not None and timeit.default_timer() > self.deadline
+                or self.node_limit is not None and self.node_count >= self.node_limit):
+            raise SearchStopped()
+
+    def cancel(self):
+        """
+        Stops the budgeted search in progress, e.g. from another thread or a 
+        signal handler. The search returns the bounds proven so far. If no
+        search is in progress, the next one stops at its first budget check.
+        """
+        self.cancelled.set()
+
+    def split_tasks(self, board_inst: board.Board, group: dict, tasks: collections.deque):
+        """
+        Adds the tasks to solve the board state after a root move. The board 
+        state is one task, or with split_depth 2 each reply is a task unless 
+        the board state is decided by an immediate win or a forced move.
+        :param board_inst: the board instance after the root move
+        :param group:      the group of the root move
+        :param tasks:      the queue of (group, position, mask, moves, is_reply) tasks
+        """
+        group['best'] = self.get_solved(board_inst, board_inst.canonical_key())
+        if group['best'] is not None:
+            return
+
+        empty = board_inst.board_mask & ~board_inst.mask
+        if (self.split_depth == 1
+                or board_inst.get_num_moves() == board_inst.cells
+                or board_inst.winning_cells(board_inst.position) & empty
+                or board_inst.winning_cells(board_inst.position ^ board_inst.mask) & empty):
+            tasks.append((group, board_inst.position, board_inst.mask, board_inst.moves, False))
+            return
+
+        # Replies which lead to symmetric board states have the same score.
+        replies = set()
+        for move in self.order_moves(board_inst):
+            board_inst.play(move)
+            key = board_inst.canonical_key()
+            if key not in replies:
+                replies.add(key)
+                tasks.append((group, board_inst.position, board_inst.mask, board_inst.moves, True))
+            board_inst.undo(move)
+
+    def close(self):
+        """
+        Shuts down the pool of worker processes.
+        """
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def solve(self, board_inst: board.Board, min_score: int = None, max_score: int = None) -> int:
+        """
+        Solves a move with the search mode of the solver. If bounds are given, 
+        a score below min_score returns at most min_score and a score above 
+        max_score returns at least max_score, which is cheaper to prove.
+        :param board_inst: the board instance being solved
+        :param min_score:  the min score to solve exactly
+        :param max_score:  the max score to solve exactly
+        :return:               the score of the board instance
+        """
+        key = board_inst.canonical_key()
+        score = self.get_solved(board_inst, key)
+        if score is not None:
+            if min_score is not None and score < min_score:
+                return min_score
+            if max_score is not None and score > max_score:
+                return max_score
+            return score
+
+        if self.search == 'full_window':
+            score = self.solve_full_window(board_inst, min_score, max_score)
+        else:
+            score = self.solve_null_window(board_inst, min_score, max_score)
+
+        if min_score is None and max_score is None:
+            self.proven[key] = score
+        return score
+
+    def get_solved(self, board_inst: board.Board, key: int):
+        """
+        Gets the score of a board state already proven this game, in the 
+        tablebase or in the book, so it is not searched again.
+        :param board_inst: the board instance being solved
+        :param key:        the canonical key of the board instance
+        :return:           the score, None if the board state is not solved
+        """
+        score = self.proven.get(key)
+        if score is None and self.tablebase is not None:
+            score = self.tablebase.get(board_inst)
+        if score is None and self.book is not None:
+            score = self.book.get(board_inst)
+        return score
+
+    def new_game(self):
+        """
+        Clears the search results kept between solves of the same game.
+        """
+        self.proven.clear()
+        self.mem_table.clear()
+        self.killers = [[] for _ in range(self.default_board.cells)]
+        self.history = [0] * self.default_board.bits
+
+    def solve_full_window(self, board_inst: board.Board, 
+                          min_score: int = None, max_score: int = None) -> int:
         """
         Solves a move with the negamax algorithm with alpha-beta pruning.
         :param board_inst: the board instance being solved
+        :param min_score:  the min score to solve exactly
+        :param max_score:  the max score to solve exactly
+        :return:               the score of the board instance
+        """
+        alpha = -board_inst.cells if min_score is None else min_score - 1
+        beta = board_inst.cells if max_score is None else max_score + 1
+        score = self.negamax(board_inst, alpha, beta)
+        if min_score is not None and score < min_score:
+            return min_score
+        if max_score is not None and score > max_score:
+            return max_score
+        return score
+
+    def solve_null_window(self, board_inst: board.Board, 
+                          min_score: int = None, max_score: int = None) -> int:
+        """
+        Solves a move by binary searching the score with null window searches.
+        A null window [med, med+1] only proves whether the score is > med, 
+        which prunes far more than a full window. Each search narrows the 
+        range [min, max] of the score until it converges. Searches reuse the 
+        bounds of the previous searches from the transposition table.
+        :param board_inst: the board instance being solved
+        :param min_score:  the min score to solve exactly
+        :param max_score:  the max score to solve exactly
         :return:               the score of the board instance
         """
-        return self.negamax(board_inst, 
-                            -(board_inst.M * board_inst.N),
-                            board_inst.M * board_inst.N)
+        range_min, range_max = self.get_bounds(board_inst)
+        if min_score is None or min_score < range_min:
+            min_score = range_min
+        if max_score is None or max_score > range_max:
+            max_score = range_max
+
+        while min_score < max_score:
+            min_score, max_score = self.narrow_bounds(board_inst, min_score, max_score)
+        return min_score
+
+    def get_bounds(self, board_inst: board.Board) -> tuple:
+        """
+        Returns the bounds of the score of a board state known without a search,
+        from the board and the bounds proven by previous solves, e.g. from 
+        earlier turns.
+        :param board_inst: the board instance being solved
+        :return:           (min score, max score)
+        """
+        min_score, max_score = board_inst.get_score_range()
+        memo = self.mem_table.get(board_inst.canonical_key())
+        if memo is not None:
+            min_score = max(min_score, memo[0])
+            max_score = min(max_score, memo[1])
+        return min_score, max_score
+
+    def narrow_bounds(self, board_inst: board.Board, min_score: int, max_score: int) -> tuple:
+        """
+        Narrows the bounds of the score of a board state with one null window 
+        search.
+        :param board_inst: the board instance being solved
+        :param min_score:  the min score of the board instance
+        :param max_score:  the max score of the board instance
+        :return:           the narrowed (min score, max score)
+        """
+        med = min_score + (max_score - min_score) // 2
+        # Search near 0 first as most scores of a strong solve are close to a draw.
+        if med <= 0 and int(min_score / 2) < med:
+            med = int(min_score / 2)
+        elif med >= 0 and int(max_score / 2) > med:
+            med = int(max_score / 2)
+
+        score = self.negamax(board_inst, med, med + 1)
+        if score <= med:
+            return min_score, score
+        return score, max_score
 
     def get_node_count(self) -> int:
         """
@@ -154,43 +851,103 @@ class Solver:
         """
         self.node_count = 0
 
-    def set_score_each(self, move: np.uint, value: int):
-        row = int(move) // self.default_board.M
-        col = int(move) % self.default_board.M 
+    def enable_stats(self):
+        """
+        Starts recording search statistics. Stats are off by default as the
+        counters slow down the search.
+        """
+        # Imported here so a solver without stats does not load the stats module and json.
+        import stats
+
+        if self.stats is None:
+            self.stats = stats.SearchStats()
+
+    def disable_stats(self):
+        """
+        Stops recording search statistics and discards the stats recorded.
+        """
+        self.stats = None
+
+    def get_stats(self):
+        """
+        Returns the search statistics recorded since stats were enabled. With
+        workers the stats of the worker processes are merged in, except the 
+        times of root moves which are only recorded when solving serially.
+        :return: the search statistics, None if stats are disabled
+        """
+        return self.stats
+
+    def get_tt_stats(self) -> dict:
+        """
+        Returns the hit, miss and collision counters of the transposition table.
+        :return: the counters of the transposition table
+        """
+        return self.mem_table.get_stats()
+
+    def reset_tt_stats(self):
+        """
+        Resets the counters of the transposition table to 0.
+        """
+        self.mem_table.reset_stats()
+
+    def set_score_each(self, move: int, value: int):
+        row = move // self.default_board.stride
+        col = move % self.default_board.stride
         
         self.score_each[row][col] = value
 
     def generate_search_order(self) -> list:
         """
-        Generate the search order starting from the centre and spiralling 
-        outwards clockwise. The theory is that moves played near the centre 
-        have more impactful branches which will create more opportunities for 
-        alpha-beta pruning.
-        :return: the search order generated
+        Returns the search order of the board size, starting from the centre 
+        and spiralling outwards clockwise (see board.get_search_order).
+        :return: the search order
         """
-        rows, cols = self.default_board.N, self.default_board.M
-        board = [[r * cols + c for c in range(cols)] for r in range(rows)]              
+        return self.default_board.geometry.search_order
 
-        top, bottom, left, right = 0, rows-1, 0, cols-1
-        result = []
-        
-        while len(result) < rows * cols:
-            for i in range(left, right+1):
-                result.append(board[top][i])
-            top += 1
-            
-            for i in range(top, bottom+1):
-                result.append(board[i][right])
-            right -= 1
-            
-            if top <= bottom:
-                for i in range(right, left-1, -1):
-                    result.append(board[bottom][i])
-                bottom -= 1
-            
-            if left <= right:
-                for i in range(bottom, top-1, -1):
-                    result.append(board[i][left])
-                left += 1
-
-        return list(reversed(result))
+
+"""
+Worker process functions for Solver.solve_score_each_parallel.
+"""
+_worker_options = {}
+_worker_solvers = {}
+
+
+def _init_worker(options: dict):
+    """
+    Initialises a worker process with the options of the parent solver.
+    :param options: the options to create solvers with
+    """
+    _worker_options.update(options)
+
+
+def _solve_task(M: int, N: int, k_in_row: int, position: int, mask: int, moves: int,
+                min_score: int, max_score: int, with_stats: bool = False) -> tuple:
+    """
+    Solves a board state in a worker process. Each worker keeps a solver per 
+    board size so its transposition table is reused between tasks.
+    :param M:         the board width
+    :param N:         the board height
+    :param k_in_row:  the tokens in a row to win
+    :param position:  the position of the board state
+    :param mask:      the mask of the board state
+    :param moves:     the moves played of the board state
+    :param min_score: the min score to solve exactly
+    :param max_score: the max score to solve exactly
+    :param with_stats: if the search statistics of the task are returned
+    :return:          (score, nodes searched, stats dict or None)
+    """
+    if (M, N, k_in_row) not in _worker_solvers:
+        default_board = board.Board(M=M, N=N, k_in_row=k_in_row)
+        _worker_solvers[(M, N, k_in_row)] = Solver(default_board, **_worker_options)
+    solve = _worker_solvers[(M, N, k_in_row)]
+
+    board_inst = board.Board(M=M, N=N, k_in_row=k_in_row, position=position, mask=mask, moves=moves)
+    start_nodes = solve.get_node_count()
+    if with_stats:
+        solve.enable_stats()
+        solve.stats.reset()
+    else:
+        solve.disable_stats()
+    score = solve.solve(board_inst, min_score, max_score)
+    task_stats = solve.stats.to_dict() if solve.stats is not None else None
+    return score, solve.get_node_count() - start_nodes, task_stats
@@ -0,0 +1,132 @@
+"""
+Alson Lee
+Date: 15/03/24
+
+The stats module contains the search statistics recorded by the solver.
+"""
+
+import json
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    Returns the p-th percentile of values by the nearest rank.
+    :param values: the values
+    :param p:      the percentile between 0 and 100
+    :return:       the percentile, None if there are no values
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, -(-len(values) * p // 100) - 1)]
+
+
+"""
+Class to record statistics of the search of a solver.
+"""
+class SearchStats:
+    """
+    Counters are plain attributes which the solver increments during the
+    search when stats are enabled. Depths are the number of moves played and
+    cutoff indices are the positions in the ordered move list of the moves
+    which caused a beta cutoff.
+    """
+
+    def __init__(self):
+        self.nodes_per_depth = {}     # Nodes searched at each depth
+        self.cutoffs = 0              # Number of beta cutoffs
+        self.cutoff_indices = {}      # Number of cutoffs at each index of the move list
+        self.tt_probes = 0            # Transposition table lookups
+        self.tt_hits = 0              # Transposition table lookups which found the key
+        self.win_checks = 0           # Checks for winning cells or winning moves
+        self.root_move_times = {}     # Seconds to solve each root move, by cell number
+
+    def add_node(self, depth: int):
+        """
+        Records a node searched.
+        :param depth: the number of moves played of the node
+        """
+        self.nodes_per_depth[depth] = self.nodes_per_depth.get(depth, 0) + 1
+
+    def add_cutoff(self, index: int):
+        """
+        Records a beta cutoff.
+        :param index: the index in the move list of the move which caused the cutoff
+        """
+        self.cutoffs += 1
+        self.cutoff_indices[index] = self.cutoff_indices.get(index, 0) + 1
+
+    def add_tt_probe(self, hit: bool):
+        """
+        Records a transposition table lookup.
+        :param hit: if the lookup found the key
+        """
+        self.tt_probes += 1
+        if hit:
+            self.tt_hits += 1
+
+    def add_root_move_time(self, cell: int, seconds: float):
+        """
+        Records the time to solve a root move.
+        :param cell:    the cell number of the root move
+        :param seconds: the time to solve the root move
+        """
+        self.root_move_times[cell] = self.root_move_times.get(cell, 0) + seconds
+
+    def get_nodes(self) -> int:
+        """
+        Returns the total number of nodes searched.
+        :return: the number of nodes searched
+        """
+        return sum(self.nodes_per_depth.values())
+
+    def merge(self, other: dict):
+        """
+        Adds the counters of other stats, e.g. from a worker process.
+        :param other: the stats to add, as returned by to_dict
+        """
+        for depth, nodes in other['nodes_per_depth'].items():
+            self.nodes_per_depth[int(depth)] = self.nodes_per_depth.get(int(depth), 0) + nodes
+        self.cutoffs += other['cutoffs']
+        for index, cutoffs in other['cutoff_indices'].items():
+            self.cutoff_indices[int(index)] = self.cutoff_indices.get(int(index), 0) + cutoffs
+        self.tt_probes += other['tt_probes']
+        self.tt_hits += other['tt_hits']
+        self.win_checks += other['win_checks']
+        for cell, seconds in other['root_move_times'].items():
+            self.add_root_move_time(int(cell), seconds)
+
+    def reset(self):
+        """
+        Resets all counters.
+        """
+        self.__init__()
+
+    def to_dict(self) -> dict:
+        """
+        Returns the stats as a dict.
+        :return: dict of the stats
+        """
+        return {'nodes': self.get_nodes(),
+                'nodes_per_depth': dict(sorted(self.nodes_per_depth.items())),
+                'cutoffs': self.cutoffs,
+                'cutoff_indices': dict(sorted(self.cutoff_indices.items())),
+                'tt_probes': self.tt_probes,
+                'tt_hits': self.tt_hits,
+                'win_checks': self.win_checks,
+                'root_move_times': dict(sorted(self.root_move_times.items()))}
+
+    def to_json(self) -> str:
+        """
+        Returns the stats as JSON.
+        :return: JSON string of the stats
+        """
+        return json.dumps(self.to_dict())
+
+    def save(self, path: str):
+        """
+        Writes the stats as JSON to a file.
+        :param path: the path of the file
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,248 @@
+"""
+Alson Lee
+Date: 15/03/24
+
+The tablebase module contains the endgame tablebase of every reachable board
+state of a small m,n,k-game, built by retrograde analysis.
+
+Usage: python tablebase.py M N k_in_row [path]
+"""
+
+import board
+
+import array
+import mmap
+import struct
+import sys
+import timeit
+
+"""
+Tablebase file format.
+
+Header      magic 'MNKT', version, M, N, k_in_row (big-endian)
+Entries     3^(M*N) unsigned 16-bit entries (little-endian), one per board state
+
+The entry of a board state is at its rank, the base 3 number with a digit per
+cell: 0 empty, 1 token of the current player, 2 token of the other player.
+Only canonical board states (see Board.canonical_key) have an entry. An entry
+is the result for the current player in the low 2 bits (0 not in the
+tablebase, 1 loss, 2 draw, 3 win) and the number of moves until the game ends
+with the best play of both players in the high 14 bits.
+"""
+MAGIC = b'MNKT'
+VERSION = 1
+HEADER = struct.Struct('>4sBHHH')
+MAX_CELLS = 16  # Max cells of a board, as the entries of a 4x4 board take 86MB
+
+LOSS, DRAW, WIN = 1, 2, 3
+
+_rank_tables = {}
+
+
+def get_tablebase_path(M: int, N: int, k_in_row: int) -> str:
+    """
+    Returns the default path of the tablebase for a board size.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :return:         the path of the tablebase
+    """
+    return f'tablebase_{M}x{N}x{k_in_row}.bin'
+
+
+def get_rank_tables(M: int, N: int) -> list:
+    """
+    Returns tables of the rank of the tokens of each row. Table r maps the M
+    bits of row r to the sum of 3^cell of its tokens.
+    :param M: the board width
+    :param N: the board height
+    :return:  list of a table per row
+    """
+    if (M, N) not in _rank_tables:
+        _rank_tables[(M, N)] = [[sum(3 ** (r * M + c) for c in range(M) if row >> c & 1)
+                                 for row in range(1 << M)] for r in range(N)]
+    return _rank_tables[(M, N)]
+
+
+def get_rank(M: int, N: int, position: int, mask: int) -> int:
+    """
+    Returns the rank of a board state, its index in the tablebase.
+    :param M:        the board width
+    :param N:        the board height
+    :param position: the position of the board state
+    :param mask:     the mask of the board state
+    :return:         the rank
+    """
+    tables = get_rank_tables(M, N)
+    opponent = position ^ mask
+    row_mask = (1 << M) - 1
+    rank = 0
+    for r in range(N):
+        shift = r * (M + 1)
+        rank += tables[r][position >> shift & row_mask] + 2 * tables[r][opponent >> shift & row_mask]
+    return rank
+
+
+def encode(score: int, moves: int, cells: int) -> int:
+    """
+    Encodes the score of a board state as an entry. A win has the score
+    (cells - n + 1) // 2 where n is the number of moves played before the
+    winning move, so n is found from the score and the player who wins.
+    :param score: the score of the board state, as of Solver.negamax
+    :param moves: the number of moves played of the board state
+    :param cells: the number of cells of the board
+    :return:      the entry
+    """
+    if score == 0:
+        return (cells - moves) << 2 | DRAW
+    # The current player plays moves of the same parity as moves, the other player the other parity
+    n = cells + 1 - 2 * abs(score)
+    if (n - moves) % 2 != (0 if score > 0 else 1):
+        n -= 1
+    return (n - moves + 1) << 2 | (WIN if score > 0 else LOSS)
+
+
+def decode(entry: int, moves: int, cells: int):
+    """
+    Decodes an entry as the score of a board state.
+    :param entry: the entry
+    :param moves: the number of moves played of the board state
+    :param cells: the number of cells of the board
+    :return:      the score, None if the board state is not in the tablebase
+    """
+    result, distance = entry & 3, entry >> 2
+    if result == DRAW:
+        return 0
+    if result == 0:
+        return None
+    score = (cells - (moves + distance - 1) + 1) // 2
+    return score if result == WIN else -score
+
+
+def generate_tablebase(M: int, N: int, k_in_row: int, path: str) -> int:
+    """
+    Builds the tablebase of every reachable board state and writes it to a
+    file. The canonical board states are found move by move from the empty
+    board, then solved from the last move back to the first, where each board
+    state is scored from the scores of the board states after each move.
+    Board states which have been won are not stored.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :param path:     the path of the tablebase file
+    :return:         the number of board states stored
+    """
+    assert M * N <= MAX_CELLS, 'board is too large for a tablebase'
+    board_inst = board.Board(M=M, N=N, k_in_row=k_in_row)
+    cells = M * N
+    position_mask = (1 << board_inst.bits) - 1
+
+    def set_state(key: int, moves: int):
+        board_inst.position, board_inst.mask, board_inst.moves = key & position_mask, key >> board_inst.bits, moves
+
+    # Canonical keys of the board states of each number of moves
+    levels = [{board_inst.canonical_key()}]
+    for moves in range(cells):
+        next_level = set()
+        for key in levels[moves]:
+            set_state(key, moves)
+            for move in range(board_inst.bits):
+                if board_inst.is_valid_move(move) and not board_inst.is_winning_move(move):
+                    board_inst.play(move)
+                    next_level.add(board_inst.canonical_key())
+                    board_inst.undo(move)
+        levels.append(next_level)
+
+    # Retrograde analysis from the full board back to the empty board
+    entries = array.array('H', bytes(2 * 3 ** cells))
+    for moves in range(cells, -1, -1):
+        for key in levels[moves]:
+            set_state(key, moves)
+            if moves == cells:
+                score = 0
+            else:
+                score = -cells
+                for move in range(board_inst.bits):
+                    if not board_inst.is_valid_move(move):
+                        continue
+                    if board_inst.is_winning_move(move):
+                        score = (cells - moves + 1) // 2
+                        break
+                    board_inst.play(move)
+                    child_key = board_inst.canonical_key()
+                    child_score = -decode(entries[get_rank(M, N, child_key & position_mask,
+                                                          child_key >> board_inst.bits)], moves + 1, cells)
+                    board_inst.undo(move)
+                    if child_score > score:
+                        score = child_score
+                set_state(key, moves)
+            entries[get_rank(M, N, board_inst.position, board_inst.mask)] = encode(score, moves, cells)
+
+    if sys.byteorder == 'big':
+        entries.byteswap()
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, M, N, k_in_row))
+        entries.tofile(f)
+
+    return sum(len(level) for level in levels)
+
+
+"""
+Class to look up scores of board states in a tablebase file.
+"""
+class Tablebase:
+    """
+    The tablebase file is memory-mapped, so a lookup reads one entry at the
+    rank of the canonical board state, in O(1).
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.M, self.N, self.k_in_row = HEADER.unpack_from(self.mmap, 0)
+        assert magic == MAGIC and version == VERSION, 'not a tablebase file'
+
+        self.cells = self.M * self.N
+        self.position_mask = (1 << (self.M + 1) * self.N) - 1
+
+    def get(self, board_inst: board.Board):
+        """
+        Gets the score of a board state.
+        :param board_inst: the board instance to look up
+        :return:           the score, None if the board state is not in the tablebase
+        """
+        if (board_inst.M, board_inst.N, board_inst.k_in_row) != (self.M, self.N, self.k_in_row):
+            return None
+
+        key = board_inst.canonical_key()
+        rank = get_rank(self.M, self.N, key & self.position_mask, key >> board_inst.bits)
+        offset = HEADER.size + 2 * rank
+        entry = self.mmap[offset] | self.mmap[offset + 1] << 8
+        return decode(entry, board_inst.get_num_moves(), self.cells)
+
+    def close(self):
+        """
+        Closes the memory-mapped tablebase file.
+        """
+        self.mmap.close()
+
+
+def main():
+    if len(sys.argv) not in (4, 5):
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    M, N, k_in_row = (int(arg) for arg in sys.argv[1:4])
+    path = sys.argv[4] if len(sys.argv) == 5 else get_tablebase_path(M, N, k_in_row)
+
+    start = timeit.default_timer()
+    size = generate_tablebase(M, N, k_in_row, path)
+    end = timeit.default_timer()
+
+    print(f'Solved {size} board states in {end - start:.2f}s')
+    print(f'Tablebase written to {path}')
+
+
+if __name__ == '__main__':
+    main()
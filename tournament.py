@@ -0,0 +1,163 @@
+"""
+Alson Lee
+Date: 15/03/24
+
+The tournament module plays games between two solver configurations without
+input, to compare their strength and speed.
+
+Usage: python tournament.py M N k_in_row games [path]
+"""
+
+import board
+import mcts
+import solver
+import stats
+
+import concurrent.futures
+import json
+import os
+import random
+import sys
+import timeit
+
+"""
+TOURNAMENT SETTINGS
+"""
+# Players are the engine, 'negamax' or 'mcts', and the options of its solver
+PLAYER_A = {'engine': 'negamax', 'ordering': ('threats',)}
+PLAYER_B = {'engine': 'negamax', 'ordering': ()}
+OPENING_MOVES = 2          # Random moves played before the players, so games differ
+SEED = 0                   # Seed of the openings and of ties between best moves
+WORKERS = os.cpu_count()   # Number of processes to play games in parallel
+RESULTS_PATH = 'tournament.jsonl'  # Default path of the moves of each game
+PERCENTILES = (50, 90, 99)
+
+
+def make_solver(player: dict, board_inst: board.Board):
+    """
+    Creates the solver of a player.
+    :param player:     the engine and options of the player
+    :param board_inst: the default board of the solver
+    :return:           the solver
+    """
+    options = dict(player)
+    engine = options.pop('engine', 'negamax')
+    if engine == 'mcts':
+        return mcts.MCTSSolver(board_inst, **options)
+    assert engine == 'negamax', 'unknown engine'
+    return solver.Solver(board_inst, **options)
+
+
+def play_game(M: int, N: int, k_in_row: int, players: tuple, game: int) -> tuple:
+    """
+    Plays a game between two players. Player A moves first in even games and
+    player B in odd games. Each player plays a move with the best score, with
+    ties broken at random.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :param players:  the (player A, player B) configurations
+    :param game:     the number of the game
+    :return:         (winner 'A', 'B' or None for a draw, list of move records)
+    """
+    rng = random.Random(f'{SEED}-{game}')
+    board_state = board.Board(M=M, N=N, k_in_row=k_in_row)
+    names = ('A', 'B') if game % 2 == 0 else ('B', 'A')
+    solvers = {name: make_solver(player, board.Board(M=M, N=N, k_in_row=k_in_row))
+               for name, player in zip(('A', 'B'), players)}
+
+    records = []
+    winner = None
+    while board_state.get_num_moves() < M * N:
+        name = names[board_state.get_num_moves() % 2]
+        if board_state.get_num_moves() < OPENING_MOVES:
+            empty = [cell for cell in range(M * N) if board_state.is_valid_move(board_state.cell_to_move(cell))]
+            cell, score, nodes, move_time = rng.choice(empty), None, 0, 0
+        else:
+            solve = solvers[name]
+            solve.reset_node_count()
+            start = timeit.default_timer()
+            move_scores = solve.solve_score_each(board_state)
+            move_time = timeit.default_timer() - start
+            nodes = solve.get_node_count()
+
+            score = max(score for row in move_scores for score in row if score is not None)
+            cell = rng.choice([r * M + c for r in range(N) for c in range(M) if move_scores[r][c] == score])
+
+        records.append({'game': game, 'move': board_state.get_num_moves(), 'player': name, 'cell': cell,
+                        'score': score, 'time': move_time, 'nodes': nodes})
+
+        move = board_state.cell_to_move(cell)
+        if board_state.is_winning_move(move):
+            winner = name
+            break
+        board_state.play(move)
+
+    for solve in solvers.values():
+        solve.close()
+    return winner, records
+
+
+def run_tournament(M: int, N: int, k_in_row: int, games: int, path: str = RESULTS_PATH,
+                   players: tuple = (PLAYER_A, PLAYER_B), workers: int = WORKERS) -> dict:
+    """
+    Plays games between two players in a pool of worker processes and writes
+    the record of each move to a JSONL file as each game finishes.
+    :param M:        the board width
+    :param N:        the board height
+    :param k_in_row: the tokens in a row to win
+    :param games:    the number of games
+    :param path:     the path of the JSONL file
+    :param players:  the (player A, player B) configurations
+    :param workers:  the number of processes
+    :return:         dict of the results of player A and the move stats of each player
+    """
+    results = {'wins': 0, 'draws': 0, 'losses': 0}
+    times = {'A': [], 'B': []}
+    nodes = {'A': [], 'B': []}
+
+    with open(path, 'w') as f, concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(play_game, M, N, k_in_row, players, game) for game in range(games)]
+        for future in concurrent.futures.as_completed(futures):
+            winner, records = future.result()
+            results['wins' if winner == 'A' else 'losses' if winner == 'B' else 'draws'] += 1
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+                if record['score'] is not None:
+                    times[record['player']].append(record['time'])
+                    nodes[record['player']].append(record['nodes'])
+            f.flush()
+
+    for name in ('A', 'B'):
+        results[name] = {'moves': len(times[name]),
+                         'nodes': sum(nodes[name]),
+                         **{f'p{p}': stats.percentile(times[name], p) for p in PERCENTILES},
+                         'max': max(times[name], default=None)}
+    return results
+
+
+def main():
+    if len(sys.argv) not in (5, 6):
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    M, N, k_in_row, games = (int(arg) for arg in sys.argv[1:5])
+    path = sys.argv[5] if len(sys.argv) == 6 else RESULTS_PATH
+
+    results = run_tournament(M, N, k_in_row, games, path)
+
+    print(f'{M}x{N}x{k_in_row}, {games} games')
+    print(f'A {PLAYER_A}')
+    print(f'B {PLAYER_B}')
+    print(f'A wins {results["wins"] / games:.1%}  draws {results["draws"] / games:.1%}  '
+          f'losses {results["losses"] / games:.1%}')
+    for name in ('A', 'B'):
+        player_stats = results[name]
+        latencies = '  '.join(f'p{p} {player_stats[f"p{p}"] * 1000:.1f}ms' for p in PERCENTILES
+                              if player_stats[f'p{p}'] is not None)
+        print(f'{name}: {player_stats["moves"]} moves  {player_stats["nodes"]:,} nodes  {latencies}')
+    print(f'Moves written to {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Alson Lee
+Date: 15/03/24
+
+The transposition module contains a fixed size memo of solved board states.
+"""
+
+"""
+Fixed size transposition table which stores alpha-beta bounds of board states.
+"""
+class TranspositionTable:
+    """
+    The table is a preallocated array of entries indexed by key % size, so the
+    memory used stays flat no matter how long the solver runs. Each entry
+    stores the full key to detect collisions, a lower and upper bound on the
+    score of the board state and the depth (number of empty cells) it was
+    searched at.
+
+    A score is exact when lower == upper. Otherwise the true score of the board
+    state lies within [lower, upper].
+    """
+
+    DEFAULT_SIZE = 1048573  # Prime number close to 2^20
+    REPLACEMENT_POLICIES = ('depth', 'always')
+
+    def __init__(self, size=DEFAULT_SIZE, replacement='depth'):
+        assert size > 0, 'size must be positive'
+        assert replacement in self.REPLACEMENT_POLICIES, 'unknown replacement policy'
+
+        self.size = size
+        self.replacement = replacement
+
+        self.keys = [None] * size
+        self.lowers = [0] * size
+        self.uppers = [0] * size
+        self.depths = [0] * size
+
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def get(self, key: int):
+        """
+        Gets the bounds stored for a key.
+        :param key: the key of the board state
+        :return:    (lower, upper) bounds of the score, None if not stored
+        """
+        i = key % self.size
+        if self.keys[i] == key:
+            self.hits += 1
+            return self.lowers[i], self.uppers[i]
+        self.misses += 1
+        return None
+
+    def put(self, key: int, lower: int, upper: int, depth: int):
+        """
+        Stores the bounds for a key. Bounds for a key already stored are
+        merged, otherwise the entry in the slot is evicted according to the
+        replacement policy.
+        :param key:   the key of the board state
+        :param lower: the lower bound of the score
+        :param upper: the upper bound of the score
+        :param depth: the number of empty cells of the board state
+        """
+        i = key % self.size
+        stored_key = self.keys[i]
+
+        if stored_key == key:
+            # Both bounds hold for the same board state so keep the tightest.
+            if self.lowers[i] > lower:
+                lower = self.lowers[i]
+            if self.uppers[i] < upper:
+                upper = self.uppers[i]
+        elif stored_key is not None:
+            self.collisions += 1
+            # Prefer to keep entries with larger subtrees as they save more work.
+            if self.replacement == 'depth' and self.depths[i] > depth:
+                return
+
+        self.keys[i] = key
+        self.lowers[i] = lower
+        self.uppers[i] = upper
+        self.depths[i] = depth
+        self.stores += 1
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters.
+        """
+        self.keys = [None] * self.size
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Resets the hit, miss, collision and store counters to 0.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def get_stats(self) -> dict:
+        """
+        Returns the counters of the table.
+        :return: dict of the hit, miss, collision and store counters
+        """
+        return {'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'collisions': self.collisions,
+                'stores': self.stores}